@@ -0,0 +1,414 @@
+"""
+Headless HTTP API of the simulator, independent from Streamlit.
+
+    python api.py --port 8000 --workers 2
+
+Endpoints (JSON in, JSON out):
+    GET  /health
+    GET  /metrics                 stage latencies in the Prometheus text format
+    POST /allocation              {"age": 30, "investor_profile": "Profil Équilibré"}
+    POST /weighted-return         {"age": 30, "investor_profile": ...} or {"allocation": {fund: share}}
+    POST /simulate                one profile, or {"profiles": [...]} for many
+
+A profile gives the simulate_investment parameters (years, monthly_amount, initial_amount,
+inflation_rate, withdrawal_rate, years_until_withdrawal) and either weighted_annual_return or
+age (+ investor_profile). Missing parameters take the simulator page defaults, derived from
+salary and investment_perc when those are given. The results are net of the fees and taxes
+of the allocation of the age for the status of the profile (default: Personne physique),
+or of the entry_fee, management_fee, gains_tax (paid every year) and exit_tax (paid on the
+gains realized) it gives.
+
+Bodies must be JSON objects. Invalid requests are answered with 400 Bad Request and an
+{"error": ...} object, unexpected failures with 500 Internal Server Error.
+
+Concurrent /simulate requests are micro-batched: the profiles received within a few
+milliseconds are evaluated together by one simulate_investment_batch call in a worker
+process, so the event loop never runs the simulation itself.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import os
+import signal
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+from holdi.assets import get_allocation_index, get_fee_schedule
+from holdi.engine import simulate_investment_batch
+from holdi.fees import DEFAULT_STATUS, PORTFOLIO_FEES, STATUSES
+from holdi.metrics import stage_timings
+
+
+# Same bounds as the "Nombre d'années de placement" slider
+MIN_YEARS = 3
+MAX_YEARS = 50
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+
+class RequestError(Exception):
+    """
+    Invalid request, answered with 400 Bad Request
+    """
+
+
+
+def number(data, name, default=None):
+    """
+    Finite number of a request field, or default when the field is absent
+    """
+    value = data.get(name, default)
+    if value is None:
+        raise RequestError(f"{name} is required")
+    # bool is an int for Python, not a number for the API
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise RequestError(f"{name} must be a number")
+    try:
+        value = float(value)
+    except ValueError:
+        raise RequestError(f"{name} must be a number")
+    if not math.isfinite(value):
+        raise RequestError(f"{name} must be a finite number")
+    return value
+
+
+
+def text(data, name, default, choices=None):
+    """
+    String of a request field, one of choices when given
+    """
+    value = data.get(name, default)
+    if not isinstance(value, str):
+        raise RequestError(f"{name} must be a string")
+    if choices is not None and value not in choices:
+        raise RequestError(f"{name} must be one of {', '.join(choices)}")
+    return value
+
+
+
+def normalize_profile(profile):
+    """
+    Validate a profile and fill its missing parameters like the simulator page does
+    """
+    if not isinstance(profile, dict):
+        raise RequestError("A profile must be a JSON object")
+    savings = int(number(profile, 'salary', 0) * number(profile, 'investment_perc', 0) / 100)
+    age = number(profile, 'age') if profile.get('age') is not None else None
+    investor_profile = text(profile, 'investor_profile', 'Profil Équilibré')
+    if 'weighted_annual_return' in profile:
+        weighted_annual_return = number(profile, 'weighted_annual_return')
+    elif age is not None:
+        weighted_annual_return = get_allocation_index().weighted_return(age, investor_profile)
+    else:
+        raise RequestError("A profile needs weighted_annual_return or age")
+    if 'years' in profile:
+        years = int(number(profile, 'years'))
+    elif age is not None:
+        # Default horizon of the profile form, within the slider bounds like the batch CLI
+        years = int(min(max(60 - age, MIN_YEARS), MAX_YEARS))
+    else:
+        raise RequestError("A profile needs years or age")
+    normalized = {
+        'years': years,
+        'monthly_amount': number(profile, 'monthly_amount', savings),
+        'weighted_annual_return': weighted_annual_return,
+        'initial_amount': number(profile, 'initial_amount', savings),
+        'inflation_rate': number(profile, 'inflation_rate', 2),
+        'withdrawal_rate': number(profile, 'withdrawal_rate', 0),
+        'years_until_withdrawal': number(profile, 'years_until_withdrawal', 5),
+    }
+    # Without an age there is no allocation to take the fund rates from
+    rates = (0.0,) * len(PORTFOLIO_FEES)
+    if age is not None:
+        rates = get_fee_schedule().portfolio_fees(
+            text(profile, 'status', DEFAULT_STATUS, STATUSES), get_allocation_index().allocation(age, investor_profile))
+    normalized.update((name, number(profile, name, float(rate))) for name, rate in zip(PORTFOLIO_FEES, rates))
+    if not MIN_YEARS <= normalized['years'] <= MAX_YEARS:
+        raise RequestError(f"years must be between {MIN_YEARS} and {MAX_YEARS}")
+    return normalized
+
+
+
+def simulate_profiles(profiles):
+    """
+    Simulate normalized profiles with one batch call; runs in a worker process
+    """
+    columns = {name: np.array([profile[name] for profile in profiles]) for name in profiles[0]}
+    timeline, initial_amount_array, invested_array, earnings_array, last_year_withdraw_amount = simulate_investment_batch(
+        columns['years'], columns['monthly_amount'], columns['weighted_annual_return'], columns['initial_amount'],
+        columns['inflation_rate'], columns['withdrawal_rate'], columns['years_until_withdrawal'],
+        fees=[columns[name] for name in PORTFOLIO_FEES])
+
+    results = []
+    for i, profile in enumerate(profiles):
+        years = profile['years']
+        invested, earnings = invested_array[i, :years], earnings_array[i, :years]
+        results.append({
+            'weighted_annual_return': profile['weighted_annual_return'],
+            'timeline': timeline[:years + 1].tolist(),
+            'initial_amount': initial_amount_array[i, :years].tolist(),
+            'invested': invested.tolist(),
+            'earnings': earnings.tolist(),
+            'future_value': profile['initial_amount'] + invested[-1] + earnings[-1],
+            'capital_gain': earnings[-1],
+            'invested_and_initial_value': profile['initial_amount'] + invested[-1],
+            'monthly_income': last_year_withdraw_amount[i] / 12,
+        })
+    return results
+
+
+
+class MicroBatcher:
+    """
+    Group the items submitted within max_delay seconds (up to max_batch items) into one
+    call of function, run in executor; several batches may be in flight at once
+    """
+
+    def __init__(self, function, executor, max_batch=2048, max_delay=0.005):
+        self.function = function
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = asyncio.Queue()
+        self._task = None
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def submit(self, items):
+        """
+        Results of function for items, evaluated together with concurrent submissions
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((items, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_delay
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            asyncio.create_task(self._evaluate(batch))
+
+    async def _evaluate(self, batch):
+        items = [item for request_items, _ in batch for item in request_items]
+        self.batches += 1
+        self.items += len(items)
+        try:
+            with stage_timings.span('api_batch'):
+                results = await asyncio.get_running_loop().run_in_executor(self.executor, self.function, items)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for request_items, future in batch:
+            if not future.done():
+                future.set_result(results[start:start + len(request_items)])
+            start += len(request_items)
+
+
+
+class SimulationAPI:
+    """
+    Routes of the HTTP API
+    """
+
+    def __init__(self, executor, max_batch=2048, max_delay=0.005):
+        self.batcher = MicroBatcher(simulate_profiles, executor, max_batch, max_delay)
+
+    async def handle(self, method, path, body):
+        """
+        (status, payload) of a request; payload is a JSON-serializable object or a str
+        """
+        routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/metrics'): self.metrics,
+            ('POST', '/allocation'): self.allocation,
+            ('POST', '/weighted-return'): self.weighted_return,
+            ('POST', '/simulate'): self.simulate,
+        }
+        if (method, path) not in routes:
+            known_path = any(route_path == path for _, route_path in routes)
+            return (HTTPStatus.METHOD_NOT_ALLOWED if known_path else HTTPStatus.NOT_FOUND), {'error': 'Not found'}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {'error': 'Invalid JSON'}
+        if not isinstance(data, dict):
+            return HTTPStatus.BAD_REQUEST, {'error': 'The body must be a JSON object'}
+        try:
+            return HTTPStatus.OK, await routes[method, path](data)
+        except RequestError as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except Exception:
+            # The connection still gets an answer; the traceback goes to the server log
+            traceback.print_exc(file=sys.stderr)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal server error'}
+
+    async def health(self, data):
+        return {'status': 'ok', 'batches': self.batcher.batches, 'profiles': self.batcher.items}
+
+    async def metrics(self, data):
+        return stage_timings.prometheus_text()
+
+    async def allocation(self, data):
+        index = get_allocation_index()
+        allocation = index.allocation(number(data, 'age'), text(data, 'investor_profile', 'Profil Équilibré'))
+        return dict(zip(index.funds, allocation.tolist()))
+
+    async def weighted_return(self, data):
+        index = get_allocation_index()
+        if 'allocation' in data:
+            if not isinstance(data['allocation'], dict):
+                raise RequestError("allocation must be a JSON object of fund: share")
+            shares = {fund: number(data['allocation'], fund) for fund in data['allocation']}
+            unknown = sorted(set(shares) - set(index.funds))
+            if unknown:
+                raise RequestError(f"Unknown funds: {', '.join(unknown)}")
+            weighted_annual_return = index.portfolio_returns(index.allocation_vector(shares))
+        elif 'age' in data:
+            weighted_annual_return = index.weighted_return(number(data, 'age'), text(data, 'investor_profile', 'Profil Équilibré'))
+        else:
+            raise RequestError("allocation or age is required")
+        return {'weighted_annual_return': float(weighted_annual_return)}
+
+    async def simulate(self, data):
+        if 'profiles' in data:
+            if not isinstance(data['profiles'], list) or not data['profiles']:
+                raise RequestError("profiles must be a non-empty list")
+            profiles = [normalize_profile(profile) for profile in data['profiles']]
+            return {'results': await self.batcher.submit(profiles)}
+        results = await self.batcher.submit([normalize_profile(data)])
+        return results[0]
+
+
+
+async def handle_connection(api, reader, writer):
+    """
+    Serve the HTTP/1.1 requests of one connection, keeping it alive between requests
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            try:
+                method, target, _ = request_line.decode('latin-1').split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = headers.get('content-length', '0') or '0'
+            if not length.isdigit():
+                status, payload = HTTPStatus.BAD_REQUEST, {'error': 'Invalid Content-Length'}
+                headers['connection'] = 'close'
+            elif int(length) > MAX_BODY_BYTES:
+                status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'Body too large'}
+                headers['connection'] = 'close'
+            else:
+                body = await reader.readexactly(int(length))
+                status, payload = await api.handle(method, target.split('?', 1)[0], body)
+
+            if isinstance(payload, str):
+                content, content_type = payload.encode(), 'text/plain; version=0.0.4'
+            else:
+                content, content_type = json.dumps(payload).encode(), 'application/json'
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            writer.write(
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + content)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+
+def warm_up():
+    """
+    Start a worker process before the first request; the engine only needs NumPy,
+    so workers never import Streamlit
+    """
+    importlib.import_module('holdi.engine')
+
+
+
+async def serve(host='127.0.0.1', port=8000, workers=None, max_batch=2048, max_delay=0.005):
+    """
+    Run the API until cancelled or terminated
+    """
+    loop = asyncio.get_running_loop()
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Start the workers before listening, so that they do not inherit the server socket
+        await asyncio.gather(*(loop.run_in_executor(executor, warm_up) for _ in range(workers)))
+
+        api = SimulationAPI(executor, max_batch, max_delay)
+        api.batcher.start()
+        server = await asyncio.start_server(lambda reader, writer: handle_connection(api, reader, writer), host, port)
+        serving = asyncio.current_task()
+        loop.add_signal_handler(signal.SIGTERM, serving.cancel)
+        print(f"Serving the simulation API on http://{host}:{port}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await api.batcher.stop()
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP API of the simulator.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument('--max-batch', type=int, default=2048, help="Maximum profiles per micro-batch (default: 2048)")
+    parser.add_argument('--max-delay', type=float, default=0.005, help="Seconds waited to fill a micro-batch (default: 0.005)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_batch, args.max_delay))
+    except KeyboardInterrupt:
+        pass
+
+
+
+if __name__ == "__main__":
+    main()
@@ -1,152 +1,190 @@
 import streamlit as st
 import numpy as np
 import plotly.graph_objs as go
-import sqlite3
 import pandas as pd
-
-
-def get_asset_data():
+import json
+import os
+import uuid
+
+from holdi.allocation import generate_asset_allocation
+from holdi.assets import get_asset_covariance, get_asset_data, get_asset_version, get_allocation_index, get_fee_schedule
+from holdi.backtest import RETURNS_PATH, backtest_outcomes, backtest_year_end_values, get_history_version, get_return_history
+from holdi.cache import canonical_key, simulation_cache
+from holdi.decumulation import MAX_WITHDRAWAL_RATE, solve_withdrawal
+from holdi.engine import simulate_investment, simulate_investment_monthly
+from holdi.fees import DEFAULT_STATUS, STATUSES
+from holdi.metrics import profile_call, span, stage_timings
+from holdi.montecarlo import calculate_portfolio_volatility, generate_asset_volatility, simulate_investment_monte_carlo, simulate_investment_multi_asset
+from holdi.scenarios import MAX_COMPARED, SCENARIO_PARAMETERS, evaluate_scenarios, scenario_store
+from holdi.solver import solve_annual_return, solve_monthly_amount, solve_years, sweep_future_value, sweep_range
+
+
+# Label on the simulator page of each parameter that can be swept
+SWEEP_LABELS = {
+    'monthly_amount': "Montant à placer par mois",
+    'weighted_annual_return': "Rendement annuel",
+    'years': "Nombre d'années de placement",
+    'initial_amount': "Montant initial",
+    'inflation_rate': "Inflation (%)",
+    'withdrawal_rate': "Taux de prélèvement (%)",
+    'years_until_withdrawal': "Années avant le début des prélèvements",
+}
+# Monte Carlo models of the simulator page: rebalancing of the per-fund model, None for the aggregated one
+MONTE_CARLO_MODELS = {
+    "Portefeuille agrégé": None,
+    "Par actif, rééquilibrage mensuel": 'monthly',
+    "Par actif, rééquilibrage annuel": 'yearly',
+    "Par actif, sans rééquilibrage": 'never',
+}
+
+
+
+def lttb_indices(x, y, max_points):
     """
-    Connect to DataBase with assets, return and allocation
+    Indices of the points kept by Largest-Triangle-Three-Buckets decimation of (x, y):
+    the first and last points, plus in each bucket the point forming the largest triangle
+    with the previous kept point and the average of the next bucket
     """
-    conn = sqlite3.connect('data/investment_data.db')
-    df = pd.read_sql_query("SELECT * FROM assets_return_allocation", conn)
-    conn.close()
-    return df
-assets_data = get_asset_data()
-
-
-def generate_asset_allocation(df, age, investor_profile='Profil Équilibré'):
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    indices = np.empty(max_points, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        indices[i + 1] = previous
+    return indices
+
+
+
+def build_projection_figure(x, initial_values, invested_values, total_values, bands=None, bands_x=None):
     """
-    Build a dictionary with assets and their allocation according to age and investor profile
+    Projection chart of the simulator page; bands are the optional (P5, P50, P95) Monte Carlo values.
+    Only numeric arrays are sent: hover values are formatted by Plotly (d3-format, space thousands separator).
     """
-    # Define age category based on the given age
-    if 20 <= age <= 24:
-        age_col = '20 à 24 ans'
-    elif 25 <= age <= 29:
-        age_col = '25 à 29 ans'
-    elif 30 <= age <= 34:
-        age_col = '30 à 34 ans'
-    elif 35 <= age <= 39:
-        age_col = '35 à 39 ans'
-    elif 40 <= age <= 44:
-        age_col = '40 à 44 ans'
-    elif 45 <= age <= 49:
-        age_col = '45 à 49 ans'
-    elif 50 <= age <= 54:
-        age_col = '50 à 54 ans'
-    elif 55 <= age <= 59:
-        age_col = '55 à 59 ans'
-    elif 60 <= age <= 64:
-        age_col = '60 à 64 ans'
-    else:
-        age_col = '65 ans et +'
-
-    df['Profil Equilibré'] = df[age_col]
-    
-    if investor_profile == 'Profil Prudent':
-        df['Profil Prudent_'] = df['Profil Equilibré'] + df['Profil Prudent']
-        asset_allocation = dict(zip(df['FONDS PROPOSÉS A TERME'], df['Profil Prudent_'].round(2)))
+    fig = go.Figure()
 
-    elif investor_profile == 'Profil Dynamique':
-        df['Profil Dynamique_'] = df['Profil Equilibré'] + df['Profil Dynamique']
-        asset_allocation = dict(zip(df['FONDS PROPOSÉS A TERME'], df['Profil Dynamique_'].round(2)))
+    # Adding trace to the figure
+    fig.add_trace(go.Scatter(x=x, y=initial_values, fill='tonexty',
+                            mode='lines', name='Montant Initial',
+                            hovertemplate='%{y:,.0f}'))
+    fig.add_trace(go.Scatter(x=x, y=invested_values, fill='tonexty',
+                            mode='lines', name='Montant Investi',
+                            hovertemplate='%{y:,.0f}'))
+    fig.add_trace(go.Scatter(x=x, y=total_values, fill='tonexty',
+                            mode='lines', name='Gains - Prélèvements',
+                            hovertemplate='%{y:,.0f}'))
+
+    if bands is not None:
+        p5, p50, p95 = bands
+        fig.add_trace(go.Scatter(x=bands_x, y=p5, mode='lines', name='P5',
+                                line=dict(width=1, color='rgba(230, 148, 255, 0.6)'),
+                                hovertemplate='%{y:,.0f}'))
+        fig.add_trace(go.Scatter(x=bands_x, y=p95, fill='tonexty', mode='lines', name='P95',
+                                line=dict(width=1, color='rgba(230, 148, 255, 0.6)'),
+                                fillcolor='rgba(230, 148, 255, 0.15)',
+                                hovertemplate='%{y:,.0f}'))
+        fig.add_trace(go.Scatter(x=bands_x, y=p50, mode='lines', name='P50',
+                                line=dict(dash='dash', color='rgb(230, 148, 255)'),
+                                hovertemplate='%{y:,.0f}'))
 
-    else :
-        asset_allocation = dict(zip(df['FONDS PROPOSÉS A TERME'], df['Profil Equilibré'].round(2)))
 
-    return asset_allocation
+    fig.update_layout(
+        title='Projection d\'Investissement selon le Profil',
+        xaxis_title='Années',
+        yaxis_title='Valeur du Portefeuille',
+        template="plotly_white",
+        separators=', ',  # Decimal comma and space as thousand separator
+        legend=dict(
+                    orientation="h",  # Horizontal layout for the legend
+                    xanchor="center",  # Anchor the legend's x-axis to center
+                    yanchor="bottom",  # Anchor the legend's y-axis to bottom
+                    x=0.5,  # Center the legend horizontally
+                    y=-0.3,  # Position the legend below the x-axis
+                    traceorder="normal",
+                    font=dict(
+                        family="sans-serif",
+                        size=12,
+                        color="white"
+                    )
+                )
+    )
+    return fig
 
 
 
-def generate_asset_return(df):
+def compute_projection(years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                       annual_volatility=None, n_paths=10000, monthly=False, max_points=500, annual_returns=None, fund_model=None, fees=None):
     """
-    Generate a dictionary with assets : returns
+    Simulation results and chart of the simulator page, memoized across sessions on the
+    canonicalized inputs and the asset table version. Monte Carlo bands are added when
+    annual_volatility is given, drawn per fund when fund_model is an (allocation, rebalancing)
+    pair. With monthly, the chart shows month-end values, decimated with LTTB to max_points.
+    annual_returns is the per-year return of the glide path, fees the fee and tax rates.
+    The returned values are shared and must not be modified.
     """
-    asset_return = df.set_index('FONDS PROPOSÉS A TERME')['Taux'].to_dict()
-    return asset_return
-
-
-def calculate_weighted_annual_return(asset_return, custom_asset_allocation):
-    # Initialize the weighted return
-    weighted_annual_return = 0
-    # Calculate the weighted return
-    for asset, allocation in custom_asset_allocation.items():
-        if asset in asset_return:
-            # Add the product of allocation and return to the weighted return
-            weighted_annual_return += allocation * asset_return[asset]
-        else:
-            # Optionally handle assets not found in the return dictionary
-            raise KeyError(f"Return data for {asset} not found")
-    
-    return weighted_annual_return
-
-
-
-def simulate_investment(years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal):
-
-    # Adjust for inflation
-    effective_annual_return = (weighted_annual_return * 100)
-
-    # List of [0,1,2,3,...] years
-    timeline = np.arange(years + 1)
-
-    # Initialize arrays
-    initial_amount_array = np.zeros(years) # This array will remain constant with the initial amount
-    invested_array = np.zeros(years)  # To store cumulative invested amounts
-    earnings_array = np.zeros(years)  # To store earnings at the end of each year
-
-    # Initialize total amount with the initial investment
-    total_value = initial_amount
-    
-
-
-    # Convert annual return to monthly return
-    monthly_return = (1 + (effective_annual_return/100)) ** (1/12) - 1
-
-    # Loop over years
-    for y in range(years):
-        # Initialize total amount for withdraw
-        last_year_withdraw_amount = 0
-
-        ##############################
-        #### initial_amount_array ####
-        ##############################
-        initial_amount_array[y] = initial_amount
-
-        ##############################
-        ####### invested_array #######
-        ##############################
-        if y == 0:
-            # Only the montlhy amount are invested in the first year
-            invested_array[y] = monthly_amount * 12
+    key = canonical_key('projection', get_asset_version(), years, monthly_amount, weighted_annual_return, initial_amount,
+                        inflation_rate, withdrawal_rate, years_until_withdrawal, annual_volatility,
+                        n_paths if annual_volatility is not None else None, max_points if monthly else None, annual_returns,
+                        fund_model if annual_volatility is not None else None, fees)
+
+    def compute():
+        with span('simulation'):
+            timeline, initial_amount_array, invested_array, earnings_array, last_year_withdraw_amount = simulate_investment(
+                years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                annual_returns, fees)
+        bands = None
+        if annual_volatility is not None and fund_model is not None:
+            with span('monte_carlo'):
+                allocation, rebalancing = fund_model
+                _, bands = simulate_investment_multi_asset(
+                    years, monthly_amount, allocation, get_allocation_index().returns, get_asset_covariance(), initial_amount,
+                    inflation_rate, withdrawal_rate, years_until_withdrawal, rebalancing, n_paths=n_paths, seed=0, fees=fees)
+        elif annual_volatility is not None:
+            with span('monte_carlo'):
+                _, bands = simulate_investment_monte_carlo(
+                    years, monthly_amount, weighted_annual_return, annual_volatility, initial_amount, inflation_rate,
+                    withdrawal_rate, years_until_withdrawal, n_paths=n_paths, seed=0, annual_returns=annual_returns,
+                    fees=fees)
+        for array in (initial_amount_array, invested_array, earnings_array):
+            array.flags.writeable = False
+
+        if monthly:
+            with span('simulation_monthly'):
+                months = np.arange(12 * years + 1)
+                total_values = simulate_investment_monthly(
+                    years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                    annual_returns, fees)[0]
+                # Same rule as the yearly invested amounts: inflation only applies after the first year
+                invested_values = initial_amount + monthly_amount * np.minimum(months, 12) \
+                    + monthly_amount * (1 + (inflation_rate / 100)) * np.maximum(months - 12, 0)
+                kept = lttb_indices(months / 12, total_values, max_points)
+            with span('figure'):
+                figure = build_projection_figure(months[kept] / 12, np.full(len(kept), float(initial_amount)),
+                                                 invested_values[kept], total_values[kept], bands, timeline[1:])
         else:
-            # Add this year's investments to last year's total investments
-            invested_array[y] = invested_array[y-1] + monthly_amount * 12 * (1 + (inflation_rate / 100))
-     
-
-
-
-        ##############################
-        ####### earnings_array #######
-        ##############################
-        # Loop over months
-        for m in range(12):
-            # Apply monthly return to the total amount at the start of the month
-            total_value *= 1 + monthly_return
-
-            # Add the monthly investment at the end of the month
-            total_value += monthly_amount * (1 + (inflation_rate / 100))
-
-            # Remove withdraws at the end of the month
-            if y >= years_until_withdrawal:
-                total_value *= 1 - (withdrawal_rate / 100 / 12)
-                last_year_withdraw_amount += total_value * withdrawal_rate / 100 / 12
-
-        earnings_array[y] = total_value - (initial_amount_array[y] + invested_array[y])
-
+            with span('figure'):
+                figure = build_projection_figure(timeline, initial_amount_array, initial_amount_array + invested_array,
+                                                 initial_amount_array + invested_array + earnings_array, bands, timeline)
+
+        return {
+            'timeline': timeline,
+            'initial_amount_array': initial_amount_array,
+            'invested_array': invested_array,
+            'earnings_array': earnings_array,
+            'last_year_withdraw_amount': last_year_withdraw_amount,
+            'figure': figure,
+        }
 
-    return timeline, initial_amount_array, invested_array, earnings_array, last_year_withdraw_amount
+    return simulation_cache.get_or_compute(key, compute)
 
 
 
@@ -193,10 +231,13 @@ def page_simulator():
                 help="Indiquez quel pourcentage de votre salaire vous épargnez.",
                 key="investment_perc_input" 
             )      
-            status = st.selectbox(
+            input_status = st.selectbox(
                 "Quel est votre statut ?",
-                ['Personne physique', 'Personne morale'],
-                help="Sélectionnez 'Personne physique' si vous êtes un individu, ou 'Personne morale' si vous représentez une entreprise ou une entité juridique."
+                STATUSES,
+                index=STATUSES.index(st.session_state.status),
+                help="Sélectionnez 'Personne physique' si vous êtes un individu, ou 'Personne morale' si vous représentez une entreprise ou une entité juridique. "
+                     "Les frais et la fiscalité appliqués aux simulations en dépendent.",
+                key="status_input"
             )   
 
         # Custom CSS to adjust the button placement
@@ -213,6 +254,7 @@ def page_simulator():
             st.session_state.salary = input_salary
             st.session_state.age = input_age
             st.session_state.investment_perc = input_investment_perc
+            st.session_state.status = input_status
             
             st.session_state.initial_amount = int(st.session_state.salary * (st.session_state.investment_perc / 100))
             st.session_state.withdrawal_rate = 0
@@ -225,6 +267,29 @@ def page_simulator():
 
 
 
+    # Everything below depends on the profile, which is the only input needing a full rerun
+    simulator_plan()
+
+
+
+@st.experimental_fragment
+def simulator_plan():
+    """
+    Parameters, allocation and results of the simulator page. Streamlit reruns only this
+    fragment when one of its widgets changes, without the page header, styles and profile form.
+    """
+    # Timed on its own when it reruns alone, as part of the page otherwise
+    with stage_timings.rerun('fragment_rerun', fragment='simulator_plan'):
+        plan_sections()
+
+
+
+def plan_sections():
+    with span('asset_data'):
+        assets_data = get_asset_data()
+
+
+
     ##############################
     ###### PARAMETERS ############
     ##############################
@@ -321,7 +386,8 @@ def page_simulator():
     with st.form("portfolio_form"):
         st.subheader("Répartition par actif")
         
-        generated_asset_allocation = generate_asset_allocation(assets_data, st.session_state.age, st.session_state.investor_profile)         
+        with span('allocation'):
+            generated_asset_allocation = generate_asset_allocation(assets_data, st.session_state.age, st.session_state.investor_profile)
         # Create columns for asset inputs
         col1, col2 = st.columns(2)
         columns = [col1, col2]
@@ -354,8 +420,24 @@ def page_simulator():
     #################################
     #### Show the Annual Return #####
     #################################
-    asset_return = generate_asset_return(assets_data)
-    weighted_annual_return = calculate_weighted_annual_return(asset_return, custom_asset_allocation)
+    glide_path = st.toggle(
+        "Allocation évolutive avec l'âge",
+        help="Chaque année, le rendement suit l'allocation de la tranche d'âge atteinte, avec le même profil. "
+             "Les modifications de la répartition par actif ne sont alors pas prises en compte.",
+        key="glide_path"
+    )
+    # Widget values are dropped on the other pages, the saved scenarios need this one
+    st.session_state.glide_path_enabled = glide_path
+    with span('weighted_return'):
+        allocation_index = get_allocation_index()
+        weighted_annual_return = float(allocation_index.portfolio_returns(allocation_index.allocation_vector(custom_asset_allocation)))
+        # Fee and tax rates of the current allocation for the status of the profile
+        fees = tuple(float(rate) for rate in get_fee_schedule().portfolio_fees(
+            st.session_state.status, allocation_index.allocation_vector(custom_asset_allocation)))
+        annual_returns = None
+        if glide_path:
+            # Enough years for the projection and for the goal seek over 50 years
+            annual_returns = allocation_index.glide_path_returns(st.session_state.age, st.session_state.investor_profile, 50)[0]
 
     # Using columns to align label and value horizontally
     col1, col2, col3 = st.columns([1,2,1])
@@ -364,60 +446,79 @@ def page_simulator():
         # Using markdown to add styling for center alignment and bold, larger text within the column
         st.markdown(f"""
         <div style='text-align: center;'>
-            <span style='font-size: 24px;'>Rendement annuel estimé</span> 
-            <span style='font-size: 28px; font-weight: bold;'>{weighted_annual_return:.2%}</span>
+            <span style='font-size: 24px;'>{"Rendement annuel moyen estimé" if glide_path else "Rendement annuel estimé"}</span> 
+            <span style='font-size: 28px; font-weight: bold;'>{annual_returns[:st.session_state.years].mean() if glide_path else weighted_annual_return:.2%}</span>
         </div>
         """, unsafe_allow_html=True)
 
 
-    st.title("")
-    timeline, initial_amount_array, invested_array, earnings_array, last_year_withdraw_amount = simulate_investment(st.session_state.years, st.session_state.monthly_amount, weighted_annual_return, st.session_state.initial_amount, st.session_state.inflation_rate, st.session_state.withdrawal_rate, st.session_state.years_until_withdrawal)
-    
-    fig = go.Figure()
-
-    # Custom function to format numbers with space as thousand separator
-    def format_number(num):
-        return "{:,.0f}".format(num).replace(',', ' ')
-    # Adding trace to the figure
-    fig.add_trace(go.Scatter(x=timeline, y=initial_amount_array, fill='tonexty',
-                            mode='lines', name='Montant Initial',
-                            hovertemplate='%{text}',
-                            text=[format_number(y) for y in (initial_amount_array)]))  # Using formatted hover texts
-    fig.add_trace(go.Scatter(x=timeline, y=initial_amount_array + invested_array, fill='tonexty',
-                            mode='lines', name='Montant Investi',
-                            hovertemplate='%{text}',
-                            text=[format_number(y) for y in (initial_amount_array + invested_array)]))  # Using formatted hover texts
-    fig.add_trace(go.Scatter(x=timeline, y=initial_amount_array + invested_array + earnings_array, fill='tonexty',
-                            mode='lines', name='Gains - Prélèvements',
-                            hovertemplate='%{text}',
-                            text=[format_number(y) for y in (initial_amount_array + invested_array + earnings_array)]))  # Using formatted hover texts
-
-
-    fig.update_layout(
-        title='Projection d\'Investissement selon le Profil',
-        xaxis_title='Années',
-        yaxis_title='Valeur du Portefeuille',
-        template="plotly_white",
-        legend=dict(
-                    orientation="h",  # Horizontal layout for the legend
-                    xanchor="center",  # Anchor the legend's x-axis to center
-                    yanchor="bottom",  # Anchor the legend's y-axis to bottom
-                    x=0.5,  # Center the legend horizontally
-                    y=-0.3,  # Position the legend below the x-axis
-                    traceorder="normal",
-                    font=dict(
-                        family="sans-serif",
-                        size=12,
-                        color="white"
-                    )
-                )
+    #################################
+    #### Monte Carlo #################
+    #################################
+    col1, col2 = st.columns(2)
+    with col1:
+        monte_carlo = st.toggle(
+            "Simulation Monte Carlo",
+            help="Simule des rendements mensuels aléatoires selon la notation du risque de chaque actif et affiche les percentiles P5, P50 et P95.",
+            key="monte_carlo"
+        )
+    with col2:
+        n_paths = st.select_slider(
+            "Nombre de scénarios",
+            options=[10000, 25000, 50000, 100000],
+            disabled=not monte_carlo,
+            key="monte_carlo_paths"
+        )
+    monte_carlo_model = st.selectbox(
+        "Modèle Monte Carlo",
+        options=list(MONTE_CARLO_MODELS),
+        disabled=not monte_carlo,
+        help="Le modèle par actif tire les rendements de chaque fonds selon leur matrice de covariance "
+             "et suit la valeur de chaque ligne, avec le rééquilibrage choisi vers l'allocation cible.",
+        key="monte_carlo_model"
     )
-    st.plotly_chart(fig, use_container_width=True)
+    with col1:
+        monthly = st.toggle(
+            "Résolution mensuelle",
+            help="Affiche la valeur du portefeuille à la fin de chaque mois plutôt que de chaque année.",
+            key="monthly_resolution"
+        )
+    with col2:
+        max_points = st.number_input(
+            "Points maximum du graphique",
+            min_value=50,
+            max_value=5000,
+            value=500,
+            step=50,
+            disabled=not monthly,
+            help="Les séries plus longues sont réduites à ce nombre de points (algorithme LTTB).",
+            key="max_points"
+        )
+
+    st.title("")
+    annual_volatility = None
+    fund_model = None
+    with span('projection'):
+        if monte_carlo:
+            annual_volatility = calculate_portfolio_volatility(generate_asset_volatility(assets_data), custom_asset_allocation)
+            rebalancing = MONTE_CARLO_MODELS[monte_carlo_model]
+            if rebalancing is not None:
+                target = allocation_index.glide_path_allocations(st.session_state.age, st.session_state.investor_profile, st.session_state.years) \
+                    if glide_path else allocation_index.allocation_vector(custom_asset_allocation)
+                fund_model = (target, rebalancing)
+        projection = compute_projection(st.session_state.years, st.session_state.monthly_amount, weighted_annual_return, st.session_state.initial_amount, st.session_state.inflation_rate, st.session_state.withdrawal_rate, st.session_state.years_until_withdrawal,
+                                        annual_volatility=annual_volatility, n_paths=n_paths, monthly=monthly, max_points=max_points,
+                                        annual_returns=annual_returns, fund_model=fund_model, fees=fees)
+    invested_array = projection['invested_array']
+    earnings_array = projection['earnings_array']
+    last_year_withdraw_amount = projection['last_year_withdraw_amount']
+    with span('chart_serialization'):
+        st.plotly_chart(projection['figure'], use_container_width=True)
 
     # Calculate the values
     future_value = st.session_state.initial_amount + invested_array[-1] + earnings_array[-1]  # Total value at the end of the simulation
     capital_gain = earnings_array[-1]  # Total earnings
-    invested_and_initial_value = st.session_state.initial_amount + invested_array[-1]  # If there's no taxes or fees separate from withdrawals
+    invested_and_initial_value = st.session_state.initial_amount + invested_array[-1]  # Amounts paid, the fees and taxes are taken from the earnings
     monthly_income = last_year_withdraw_amount / 12  # If monthly income is defined as average annual withdrawal
 
 
@@ -431,15 +532,279 @@ def page_simulator():
         st.markdown(f"<h2 style='text-align: center; font-size: medium;'>Montant investi</h2><p style='text-align: center; font-size: medium;'>{invested_and_initial_value:,.0f} €</p>".replace(',', ' '), unsafe_allow_html=True)
     with col4:
         st.markdown(f"<h2 style='text-align: center; font-size: medium;'>Revenu mensuel</h2><p style='text-align: center; font-size: medium;'>{monthly_income:,.0f} €</p>".replace(',', ' '), unsafe_allow_html=True)
+    entry_fee, management_fee, gains_tax, exit_tax = fees
+    tax = f"{exit_tax:.2%} à la sortie" if exit_tax or not gains_tax else f"{gains_tax:.2%} chaque année"
+    st.caption(f"Montants nets de frais d'entrée ({entry_fee:.2%}), de frais de gestion ({management_fee:.2%} par an) "
+               f"et de l'impôt sur les plus-values ({tax}, {st.session_state.status.lower()}).")
 
     st.title("")
 
 
+    #################################
+    #### Goal seek ##################
+    #################################
+    with st.expander("Atteindre un objectif"):
+        col1, col2 = st.columns(2)
+        with col1:
+            target_value = st.number_input(
+                "Objectif de capital (€)",
+                min_value=0,
+                value=500000,
+                step=10000,
+                help="Le montant que vous souhaitez atteindre à la fin de la période de placement.",
+                key="target_value"
+            )
+        with col2:
+            solve_for = st.radio(
+                "Calculer",
+                ["Montant à placer par mois", "Nombre d'années de placement", "Rendement annuel"],
+                key="solve_for"
+            )
+
+        simulation_inputs = dict(
+            inflation_rate=st.session_state.inflation_rate,
+            withdrawal_rate=st.session_state.withdrawal_rate,
+            years_until_withdrawal=st.session_state.years_until_withdrawal,
+            initial_amount=st.session_state.initial_amount,
+            fees=fees,
+        )
+        if solve_for == "Montant à placer par mois":
+            answer = solve_monthly_amount(target_value, st.session_state.years, weighted_annual_return, **simulation_inputs,
+                                          annual_returns=annual_returns)[0]
+            answer_text = f"{answer:,.0f} € par mois".replace(',', ' ')
+        elif solve_for == "Nombre d'années de placement":
+            answer = solve_years(target_value, st.session_state.monthly_amount, weighted_annual_return, **simulation_inputs,
+                                 annual_returns=annual_returns)[0]
+            answer_text = f"{answer:.0f} ans"
+        else:
+            # A constant return, also with the glide path
+            answer = solve_annual_return(target_value, st.session_state.years, st.session_state.monthly_amount, **simulation_inputs)[0]
+            answer_text = f"{answer:.2%} par an"
+
+        if np.isnan(answer):
+            st.warning("Objectif inatteignable avec ces paramètres.")
+        else:
+            st.markdown(f"<p style='text-align: center; font-size: 24px; font-weight: bold;'>{answer_text}</p>", unsafe_allow_html=True)
+
+
+    #################################
+    #### Sustainable withdrawals ####
+    #################################
+    with st.expander("Revenu durable"):
+        col1, col2 = st.columns(2)
+        with col1:
+            withdrawal_target = st.radio(
+                "Calculer",
+                ["Taux de prélèvement maximal", "Revenu mensuel maximal"],
+                help="Le revenu mensuel est revalorisé chaque année de l'inflation.",
+                key="withdrawal_target"
+            )
+            end_age = st.number_input(
+                "Jusqu'à l'âge de",
+                min_value=st.session_state.age + 1,
+                max_value=120,
+                value=max(90, st.session_state.age + 1),
+                step=1,
+                key="withdrawal_end_age"
+            )
+        with col2:
+            withdrawal_floor = st.number_input(
+                "Capital plancher (€)",
+                min_value=0,
+                value=0,
+                step=10000,
+                help="Le portefeuille ne doit jamais passer sous ce montant pendant les prélèvements.",
+                key="withdrawal_floor"
+            )
+            success_probability = st.slider(
+                "Probabilité de succès (%)",
+                min_value=50,
+                max_value=99,
+                value=90,
+                disabled=not monte_carlo,
+                help="Avec la simulation Monte Carlo, part des scénarios où le capital reste au-dessus du plancher.",
+                key="withdrawal_success"
+            )
+
+        horizon = end_age - st.session_state.age
+        if horizon <= np.ceil(st.session_state.years_until_withdrawal):
+            st.warning("Les prélèvements doivent commencer avant cet âge.")
+        else:
+            target = 'withdrawal_rate' if withdrawal_target == "Taux de prélèvement maximal" else 'monthly_income'
+            withdrawal_returns = allocation_index.glide_path_returns(st.session_state.age, st.session_state.investor_profile, horizon)[0] \
+                if glide_path else None
+
+            def compute_withdrawal():
+                solution = solve_withdrawal(
+                    horizon, st.session_state.monthly_amount, weighted_annual_return, st.session_state.initial_amount,
+                    st.session_state.inflation_rate, st.session_state.years_until_withdrawal, withdrawal_floor, target,
+                    annual_volatility, success_probability / 100, n_paths, seed=0, annual_returns=withdrawal_returns, fees=fees)
+                low, median, high = solution['income']
+                ages = st.session_state.age + np.arange(1, horizon + 1)
+                withdrawal_fig = go.Figure(go.Bar(x=ages, y=median, name='Revenu annuel', marker_color='rgb(99, 110, 250)',
+                                                  hovertemplate='%{x} ans<br>%{y:,.0f} €<extra></extra>'))
+                if annual_volatility is not None and target == 'withdrawal_rate':
+                    withdrawal_fig.update_traces(error_y=dict(type='data', symmetric=False, array=high - median, arrayminus=median - low),
+                                                 name='Revenu annuel (P50, P5 à P95)')
+                withdrawal_fig.update_layout(
+                    xaxis_title='Âge',
+                    yaxis_title='Revenu annuel',
+                    template="plotly_white",
+                    separators=', ',
+                )
+                solution['figure'] = withdrawal_fig
+                return solution
+
+            with span('withdrawal'):
+                withdrawal = simulation_cache.get_or_compute(
+                    canonical_key('withdrawal', get_asset_version(), horizon, st.session_state.monthly_amount, weighted_annual_return,
+                                  st.session_state.initial_amount, st.session_state.inflation_rate, st.session_state.years_until_withdrawal,
+                                  withdrawal_floor, target, annual_volatility, success_probability if monte_carlo else None,
+                                  n_paths if monte_carlo else None, withdrawal_returns, fees),
+                    compute_withdrawal)
+
+            if withdrawal['unbounded']:
+                st.info(f"Même {MAX_WITHDRAWAL_RATE:.0f} % par an maintient le capital au-dessus du plancher jusqu'à {end_age} ans : "
+                        "un prélèvement en pourcentage ne vide jamais le portefeuille, fixez un capital plancher.")
+            elif np.isnan(withdrawal['level']):
+                st.warning("Aucun prélèvement ne maintient le capital au-dessus du plancher.")
+            else:
+                answer_text = f"{withdrawal['level']:.2f} % par an" if target == 'withdrawal_rate' \
+                    else f"{withdrawal['level']:,.0f} € par mois".replace(',', ' ')
+                st.markdown(f"<p style='text-align: center; font-size: 24px; font-weight: bold;'>{answer_text}</p>", unsafe_allow_html=True)
+                if monte_carlo:
+                    st.caption(f"Le capital reste au-dessus du plancher jusqu'à {end_age} ans dans "
+                               f"{withdrawal['success_probability']:.1%} des {n_paths} scénarios.")
+                st.plotly_chart(withdrawal['figure'], use_container_width=True)
+
+
+    #################################
+    #### Sensitivity ################
+    #################################
+    with st.expander("Analyse de sensibilité"):
+        parameters = list(SWEEP_LABELS)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            x_parameter = st.selectbox("Axe horizontal", parameters, index=parameters.index('monthly_amount'),
+                                       format_func=SWEEP_LABELS.get, key="sweep_x")
+        with col2:
+            y_parameter = st.selectbox("Axe vertical", [p for p in parameters if p != x_parameter], index=0,
+                                       format_func=SWEEP_LABELS.get, key="sweep_y")
+        with col3:
+            points = st.slider("Points par axe", min_value=10, max_value=200, value=50, step=10, key="sweep_points")
+        chart_type = st.radio("Graphique", ["Carte de chaleur", "Contours"], horizontal=True, key="sweep_chart")
+        if glide_path:
+            st.caption("L'analyse de sensibilité utilise un rendement annuel constant.")
+
+        base = dict(
+            years=st.session_state.years,
+            monthly_amount=st.session_state.monthly_amount,
+            weighted_annual_return=weighted_annual_return,
+            initial_amount=st.session_state.initial_amount,
+            inflation_rate=st.session_state.inflation_rate,
+            withdrawal_rate=st.session_state.withdrawal_rate,
+            years_until_withdrawal=st.session_state.years_until_withdrawal,
+            fees=fees,
+        )
+        x_values = sweep_range(x_parameter, base[x_parameter], points)
+        y_values = sweep_range(y_parameter, base[y_parameter], points)
+
+        def compute_sweep():
+            surface = sweep_future_value(base, {x_parameter: x_values, y_parameter: y_values})
+            trace = go.Heatmap if chart_type == "Carte de chaleur" else go.Contour
+            sweep_fig = go.Figure(trace(x=x_values, y=y_values, z=surface.T, colorscale='Viridis',
+                                        colorbar=dict(title='Valeur future'),
+                                        hovertemplate='%{x}<br>%{y}<br>%{z:,.0f} €<extra></extra>'))
+            sweep_fig.update_layout(
+                xaxis_title=SWEEP_LABELS[x_parameter],
+                yaxis_title=SWEEP_LABELS[y_parameter],
+                template="plotly_white",
+                separators=', ',
+            )
+            return sweep_fig
+
+        # The figure is cached with the surface: building it costs more than the sweep itself
+        with span('sweep'):
+            sweep_fig = simulation_cache.get_or_compute(
+                canonical_key('sweep', get_asset_version(), base, x_parameter, x_values, y_parameter, y_values, chart_type),
+                compute_sweep)
+        st.plotly_chart(sweep_fig, use_container_width=True)
+
+
+    #################################
+    #### Historical backtest ########
+    #################################
+    with st.expander("Rejouer l'historique"):
+        if not os.path.exists(RETURNS_PATH):
+            st.info("Ajoutez les rendements mensuels de chaque actif dans data/monthly_returns.csv "
+                    "(une colonne date, puis une colonne par actif) pour rejouer votre plan sur l'historique.")
+        else:
+            history_months, history_returns = get_return_history().portfolio_returns(custom_asset_allocation)
+            if len(history_returns) < 12 * st.session_state.years:
+                st.warning(f"L'historique de ce portefeuille couvre {len(history_returns) / 12:.0f} ans, "
+                           f"moins que les {st.session_state.years} ans de placement.")
+            else:
+                def compute_backtest():
+                    values = backtest_year_end_values(
+                        history_returns, st.session_state.years, st.session_state.monthly_amount, st.session_state.initial_amount,
+                        st.session_state.inflation_rate, st.session_state.withdrawal_rate, st.session_state.years_until_withdrawal)
+                    outcomes = backtest_outcomes(history_months, values)
+
+                    lowest, median, highest = outcomes['bands']
+                    year_ends = np.arange(1, st.session_state.years + 1)
+                    backtest_fig = go.Figure()
+                    backtest_fig.add_trace(go.Scatter(x=year_ends, y=lowest, mode='lines', name='Minimum',
+                                                      line=dict(width=1, color='rgba(99, 110, 250, 0.6)'),
+                                                      hovertemplate='%{y:,.0f}'))
+                    backtest_fig.add_trace(go.Scatter(x=year_ends, y=highest, fill='tonexty', mode='lines', name='Maximum',
+                                                      line=dict(width=1, color='rgba(99, 110, 250, 0.6)'),
+                                                      fillcolor='rgba(99, 110, 250, 0.15)',
+                                                      hovertemplate='%{y:,.0f}'))
+                    backtest_fig.add_trace(go.Scatter(x=year_ends, y=median, mode='lines', name='Médiane',
+                                                      line=dict(dash='dash', color='rgb(99, 110, 250)'),
+                                                      hovertemplate='%{y:,.0f}'))
+                    backtest_fig.update_layout(
+                        xaxis_title='Années',
+                        yaxis_title='Valeur du Portefeuille',
+                        template="plotly_white",
+                        separators=', ',
+                    )
+                    outcomes['figure'] = backtest_fig
+                    return outcomes
+
+                with span('backtest'):
+                    backtest = simulation_cache.get_or_compute(
+                        canonical_key('backtest', get_history_version(), custom_asset_allocation, st.session_state.years,
+                                      st.session_state.monthly_amount, st.session_state.initial_amount, st.session_state.inflation_rate,
+                                      st.session_state.withdrawal_rate, st.session_state.years_until_withdrawal),
+                        compute_backtest)
+
+                st.write(f"{backtest['windows']} dates de départ entre {history_months[0]} et "
+                         f"{history_months[-12 * st.session_state.years]}.")
+                col1, col2, col3 = st.columns(3)
+                for column, name, label in ((col1, 'worst', "Pire départ"), (col2, 'median', "Départ médian"), (col3, 'best', "Meilleur départ")):
+                    with column:
+                        outcome = backtest[name]
+                        st.markdown(f"<h2 style='text-align: center; font-size: medium;'>{label} ({outcome['start']})</h2><p style='text-align: center; font-size: medium;'>{outcome['value']:,.0f} €</p>".replace(',', ' '), unsafe_allow_html=True)
+
+                st.plotly_chart(backtest['figure'], use_container_width=True)
+
+
+
+
 
 
 
 
 
+def get_workspace():
+    """
+    Identifier of the visitor's saved scenarios, kept in the page address so that they survive a refresh
+    """
+    if 'espace' not in st.query_params:
+        st.query_params['espace'] = uuid.uuid4().hex
+    return st.query_params['espace']
+
 
 
 def page_portfolio():
@@ -455,11 +820,99 @@ def page_portfolio():
     else:
         st.write("Aucune information de portefeuille disponible. Veuillez configurer votre portefeuille sur la page 'Objectif d'investissement'.")
 
+    ##############################
+    ###### SCENARIOS #############
+    ##############################
+    workspace = get_workspace()
+    current_allocation = st.session_state.get('custom_asset_allocation') or generate_asset_allocation(
+        get_asset_data(), st.session_state.age, st.session_state.investor_profile)
+    current_parameters = {name: st.session_state[name] for name in SCENARIO_PARAMETERS}
+    current_parameters.update(age=st.session_state.age, investor_profile=st.session_state.investor_profile,
+                              glide_path=st.session_state.get('glide_path_enabled', False), status=st.session_state.status)
+
+    st.subheader("Enregistrer ce scénario")
+    with st.form("scenario_form"):
+        name = st.text_input("Nom du scénario", max_chars=60,
+                             help="Un scénario du même nom est remplacé. Gardez l'adresse de la page pour retrouver vos scénarios.")
+        if st.form_submit_button("Enregistrer") and name.strip():
+            with span('scenario_save'):
+                scenario_store.save(workspace, name.strip(), current_parameters, current_allocation)
+            st.success(f"Scénario « {name.strip()} » enregistré !")
+
+    st.subheader("Comparer des scénarios")
+    saved = scenario_store.names(workspace)
+    selected = st.multiselect("Scénarios enregistrés", saved, default=saved[:5], max_selections=MAX_COMPARED)
+    with_profiles = st.checkbox("Ajouter les trois profils avec vos paramètres", value=not saved)
+
+    with span('scenario_load'):
+        scenarios = scenario_store.load(workspace, selected)
+    if with_profiles:
+        allocation_index = get_allocation_index()
+        for profile in ("Profil Prudent", "Profil Équilibré", "Profil Dynamique"):
+            allocation = allocation_index.allocation(st.session_state.age, profile)
+            scenarios.append({'name': profile, 'parameters': {**current_parameters, 'investor_profile': profile},
+                              'allocation': dict(zip(allocation_index.funds, allocation.tolist()))})
+    if not scenarios:
+        st.write("Enregistrez un scénario ou ajoutez les profils pour les comparer.")
+        return
+
+    with span('scenario_compare'):
+        results = evaluate_scenarios(scenarios, get_allocation_index(), get_fee_schedule())
+    fig = go.Figure()
+    for scenario, values in zip(scenarios, results['values']):
+        years = scenario['parameters']['years']
+        fig.add_trace(go.Scatter(x=np.arange(1, years + 1), y=values[:years], mode='lines', name=scenario['name'],
+                                 hovertemplate='%{y:,.0f}'))
+    fig.update_layout(
+        title='Comparaison des scénarios',
+        xaxis_title='Années',
+        yaxis_title='Valeur du Portefeuille',
+        template="plotly_white",
+        separators=', ',
+        legend=dict(orientation="h", xanchor="center", yanchor="bottom", x=0.5, y=-0.3),
+    )
+    st.plotly_chart(fig)
+
+    st.dataframe(pd.DataFrame({
+        'Scénario': [scenario['name'] for scenario in scenarios],
+        'Rendement annuel': [f"{value:.2%}" for value in results['weighted_annual_return']],
+        'Valeur future': [f"{value:,.0f} €".replace(',', ' ') for value in results['future_value']],
+        'Revenu mensuel': [f"{value:,.0f} €".replace(',', ' ') for value in results['monthly_income']],
+    }), hide_index=True)
+
+    if saved:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            to_delete = st.selectbox("Supprimer un scénario", saved, label_visibility="collapsed")
+        with col2:
+            if st.button("Supprimer"):
+                scenario_store.delete(workspace, to_delete)
+                st.rerun()
+
 
 
 def page_admin():
     st.header("Admin")
-    st.write(assets_data)
+    st.write(get_asset_data())
+
+    st.subheader("Cache des simulations")
+    st.write(simulation_cache.stats())
+
+    st.subheader("Temps par étape")
+    st.dataframe(pd.DataFrame(stage_timings.summary()), hide_index=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Exporter (Prometheus)", stage_timings.prometheus_text(), file_name="holdi_metrics.prom", mime="text/plain")
+    with col2:
+        st.download_button("Exporter (JSON)", json.dumps(stage_timings.summary(), indent=2), file_name="holdi_metrics.json", mime="application/json")
+
+    st.subheader("Profilage")
+    def request_profile():
+        st.session_state.profile_next_rerun = True
+    st.button("Profiler la prochaine exécution du simulateur", on_click=request_profile,
+              help="Le prochain affichage de la page 'Objectif d'investissement' est exécuté sous cProfile.")
+    if 'last_profile' in st.session_state:
+        st.code(st.session_state.last_profile)
 
 
 
@@ -471,6 +924,8 @@ def main():
         st.session_state.age = 30
     if 'investment_perc' not in st.session_state:
         st.session_state.investment_perc = 17
+    if 'status' not in st.session_state:
+        st.session_state.status = DEFAULT_STATUS
 
     if 'initial_amount' not in st.session_state:
         st.session_state.initial_amount = int(st.session_state.salary * (st.session_state.investment_perc / 100))
@@ -538,7 +993,10 @@ def main():
 
     choice = st.sidebar.radio("", ["📊 Objectif d'investissement", "💰 Portefeuille", "🔧 Admin"])
     if choice == "📊 Objectif d'investissement":
-        page_simulator()
+        if st.session_state.pop('profile_next_rerun', False):
+            st.session_state.last_profile = profile_call(page_simulator)
+        else:
+            page_simulator()
     elif choice == "💰 Portefeuille":
         page_portfolio()
     elif choice == "🔧 Admin":
@@ -548,7 +1006,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with stage_timings.rerun():
+        main()
 
 
 
@@ -0,0 +1,3 @@
+"""
+Micro and macro benchmarks of the simulator, see `python -m benchmarks --help`.
+"""
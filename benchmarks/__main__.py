@@ -0,0 +1,140 @@
+"""
+Run the benchmarks, record JSON baselines and fail on regressions.
+
+    python -m benchmarks run [--layer micro|macro|all] [--output benchmarks/baseline.json]
+    python -m benchmarks compare benchmarks/baseline.json [--threshold 0.2] [--metric min]
+    python -m benchmarks imports [--rounds 5]
+    python -m benchmarks load [--sessions 1 5 10 25] [--rounds 3] [--slo p95_ms=1500 ...]
+
+Timings depend on the machine, so no baseline is committed: record one with run --output
+on the reference commit before comparing. compare measures the current tree and exits
+with status 2 when the baseline file is missing and with status 1 when a benchmark of the
+baseline is slower by more than the threshold; imports exits with status 1 when a core
+module exceeds its import-time budget or loads Streamlit, Plotly or pandas; load exits
+with status 1 when a service level objective is breached at any session count.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import harness
+
+
+
+def collect(layer):
+    cases = []
+    if layer in ('micro', 'all'):
+        from benchmarks import micro
+        cases += micro.benchmarks()
+    if layer in ('macro', 'all'):
+        from benchmarks import macro
+        cases += macro.benchmarks()
+    return cases
+
+
+
+def check_imports(rounds):
+    from benchmarks import imports
+
+    failed = False
+    for row in imports.check_budgets(rounds=rounds):
+        over = row['ms'] > row['budget_ms']
+        print(f"{row['module']:<20} {row['ms']:8.1f} ms  (budget {row['budget_ms']} ms){'  OVER BUDGET' if over else ''}")
+        if row['forbidden']:
+            print(f"{row['module']} imports {', '.join(row['forbidden'])}", file=sys.stderr)
+        failed = failed or over or bool(row['forbidden'])
+    return 1 if failed else 0
+
+
+
+def parse_slo(text):
+    name, _, limit = text.partition('=')
+    if not limit:
+        raise argparse.ArgumentTypeError(f"expected name=limit, got {text!r}")
+    return name, float(limit)
+
+
+
+def check_load(args):
+    from benchmarks import load
+
+    slos = dict(load.DEFAULT_SLOS, **dict(args.slo or []))
+    results = load.run_levels(args.sessions, args.rounds, args.think_time, args.url)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'slos': slos, 'levels': results}, f, indent=2)
+
+    failed = False
+    for result in results:
+        for breach in load.slo_breaches(result, slos):
+            print(f"SLO BREACHED at {result['sessions']} sessions: {breach}", file=sys.stderr)
+            failed = True
+        for error in result['error_samples']:
+            print(f"  {error}", file=sys.stderr)
+    if not failed:
+        print(f"Every SLO met: {', '.join(f'{name} {limit:g}' for name, limit in slos.items())}.")
+    return 1 if failed else 0
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Simulator benchmarks.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Measure and optionally save a baseline")
+    run_parser.add_argument('--output', help="JSON file receiving the results")
+
+    compare_parser = subparsers.add_parser('compare', help="Measure and compare against a baseline")
+    compare_parser.add_argument('baseline', help="JSON baseline written by `run --output`")
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%% (default)")
+    compare_parser.add_argument('--metric', choices=['min', 'median'], default='min', help="Statistic compared (default: min)")
+    compare_parser.add_argument('--output', help="JSON file receiving the current results")
+
+    imports_parser = subparsers.add_parser('imports', help="Check the import-time budget of the core package")
+    imports_parser.add_argument('--rounds', type=int, default=5, help="Fresh interpreters per module, the best is kept (default: 5)")
+
+    load_parser = subparsers.add_parser('load', help="Load-test concurrent sessions against a local server")
+    load_parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10, 25], help="Concurrent session counts (default: 1 5 10 25)")
+    load_parser.add_argument('--rounds', type=int, default=3, help="Passes of the flow per session (default: 3)")
+    load_parser.add_argument('--think-time', type=float, default=0.0, help="Mean pause between interactions, in seconds (default: 0)")
+    load_parser.add_argument('--url', help="Running server, e.g. ws://127.0.0.1:8501 (default: start one)")
+    load_parser.add_argument('--slo', type=parse_slo, action='append',
+                             help="Objective as name=limit, e.g. p95_ms=1500 or throughput=5 (repeatable)")
+    load_parser.add_argument('--output', help="JSON file receiving the results")
+
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument('--layer', choices=['micro', 'macro', 'all'], default='all', help="Benchmarks to run (default: all)")
+        subparser.add_argument('--filter', help="Only run benchmarks whose name contains this text")
+    args = parser.parse_args(argv)
+
+    if args.command == 'imports':
+        return check_imports(args.rounds)
+    if args.command == 'load':
+        return check_load(args)
+
+    if args.command == 'compare':
+        # Checked before measuring, so a fresh checkout fails fast
+        try:
+            baseline = harness.load_baseline(args.baseline)
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}: record one first with "
+                  f"`python -m benchmarks run --output {args.baseline}`.", file=sys.stderr)
+            return 2
+
+    results = harness.run_benchmarks(collect(args.layer), args.filter)
+    if args.output:
+        harness.save_baseline(results, args.output)
+
+    if args.command == 'compare':
+        regressions = harness.compare(baseline, results, args.threshold, args.metric)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms ({ratio - 1:+.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regression beyond {args.threshold:.0%}.")
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
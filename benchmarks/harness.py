@@ -0,0 +1,98 @@
+"""
+Timing, baseline storage and regression comparison shared by the benchmark layers.
+"""
+import json
+import platform
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+
+
+def measure(function, rounds=20, warmup=1, min_round_time=0.005):
+    """
+    Time function over rounds rounds after warmup calls, in seconds per call.
+    Fast functions are called several times per round (like timeit.autorange)
+    so that each round lasts at least min_round_time.
+    """
+    for _ in range(warmup):
+        function()
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - start >= min_round_time:
+            break
+        number *= 10
+
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'max': max(timings),
+        'rounds': rounds,
+        'number': number,
+    }
+
+
+
+def run_benchmarks(benchmarks, name_filter=None, log=print):
+    """
+    Measure every (name, function, rounds) benchmark whose name contains name_filter
+    """
+    results = {}
+    for name, function, rounds in benchmarks:
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(function, rounds)
+        log(f"{name:<55} min {results[name]['min'] * 1000:10.3f} ms   median {results[name]['median'] * 1000:10.3f} ms")
+    return results
+
+
+
+def save_baseline(results, path):
+    """
+    Write results with the environment they were measured in
+    """
+    baseline = {
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+
+def compare(baseline, results, threshold=0.2, metric='min'):
+    """
+    Benchmarks slower than the baseline by more than threshold (0.2 = 20%),
+    as a list of (name, baseline seconds, current seconds, ratio)
+    """
+    regressions = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        ratio = current[metric] / baseline[name][metric]
+        if ratio > 1 + threshold:
+            regressions.append((name, baseline[name][metric], current[metric], ratio))
+    return regressions
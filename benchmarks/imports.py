@@ -0,0 +1,59 @@
+"""
+Import-time budget of the core package, measured with `python -X importtime`.
+
+Each module is imported in a fresh interpreter, like a short-lived worker would, and
+must stay under its budget without loading any of the heavy UI or data libraries.
+"""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time allowed for each core module, in milliseconds (NumPy alone is ~80 ms)
+IMPORT_BUDGETS = {
+    'holdi': 20,
+    'holdi.engine': 150,
+    'holdi.allocation': 150,
+    'holdi.montecarlo': 150,
+    'holdi.solver': 150,
+    'holdi.decumulation': 150,
+    'holdi.fees': 150,
+    'holdi.backtest': 150,
+    'holdi.assets': 150,
+    'holdi.cache': 150,
+    'holdi.metrics': 20,
+}
+# Modules that importing the core must never load
+FORBIDDEN_MODULES = ('streamlit', 'plotly', 'pandas', 'pyarrow', 'sqlite3')
+
+
+
+def import_time(module):
+    """
+    Cumulative import time of module in a fresh interpreter, in seconds,
+    and the set of modules loaded by the import
+    """
+    code = f"import {module}, sys; print('\\n'.join(sys.modules))"
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    for line in completed.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].rstrip() == f' {module}':
+            return int(fields[1]) / 1e6, set(completed.stdout.split())
+    raise RuntimeError(f"{module} was already imported at startup")
+
+
+
+def check_budgets(budgets=IMPORT_BUDGETS, rounds=5):
+    """
+    One row per module: best import time over rounds (ms), budget (ms) and forbidden modules loaded
+    """
+    rows = []
+    for module, budget in budgets.items():
+        best, loaded = min((import_time(module) for _ in range(rounds)), key=lambda result: result[0])
+        forbidden = sorted(name for name in FORBIDDEN_MODULES if name in loaded)
+        rows.append({'module': module, 'ms': best * 1000, 'budget_ms': budget, 'forbidden': forbidden})
+    return rows
@@ -0,0 +1,331 @@
+"""
+Load test: concurrent sessions driven through the simulator page of a local Streamlit server.
+
+Each simulated session is a websocket client speaking the protocol of the browser
+(BackMsg / ForwardMsg protobufs on /_stcore/stream), so the sessions share one server
+process exactly like real visitors. AppTest is not used here: its sessions share a
+global runtime and cannot run concurrently in one process.
+
+Every session repeats a realistic flow: profile form, parameter form, profile buttons
+and portfolio form, each interaction being one rerun of the script. The rerun latency
+is measured from the message sent to the end of the script run, and each session
+uses its own random profile so that they do not all share one cached projection.
+"""
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.NumberInput_pb2 import NumberInput
+from tornado.websocket import websocket_connect
+
+from benchmarks.macro import APP_PATH
+
+
+# Default service level objectives, checked at every session count: *_ms and errors are
+# maxima, throughput (reruns per second) is a minimum
+DEFAULT_SLOS = {'p95_ms': 1500, 'p99_ms': 3000, 'errors': 0}
+PROFILE_BUTTONS = ('button1', 'button2', 'button3')
+# Elements holding a value sent back to the server
+WIDGET_TYPES = ('number_input', 'slider', 'button', 'checkbox', 'selectbox', 'radio', 'text_input', 'multiselect')
+
+
+
+class SessionError(Exception):
+    """
+    A rerun did not complete or raised an exception in the script
+    """
+
+
+
+class Session:
+    """
+    One browser session: the widgets of the last run and the values the user gave them
+    """
+
+    def __init__(self, url, timeout=120):
+        self.url = url
+        self.timeout = timeout
+        self.widgets = {}
+        self.values = {}
+        self._cache = {}
+        self._connection = None
+
+    async def connect(self):
+        self._connection = await websocket_connect(f'{self.url}/_stcore/stream')
+
+    def close(self):
+        self._connection.close()
+
+    def widget(self, key=None, label=None):
+        """
+        Id, type, element and fragment id of the widget with this user key or label
+        """
+        for widget_id, (kind, element, fragment_id) in self.widgets.items():
+            if (key is not None and widget_id.endswith(f'-{key}')) or (label is not None and element.label == label):
+                return widget_id, kind, element, fragment_id
+        raise SessionError(f"No widget with key {key!r} or label {label!r}")
+
+    def set_value(self, key=None, label=None, value=None):
+        widget_id, kind, element, _ = self.widget(key, label)
+        self.values[widget_id] = (kind, element, value)
+
+    def value(self, key=None, label=None):
+        widget_id, kind, element, _ = self.widget(key, label)
+        if widget_id in self.values:
+            return self.values[widget_id][2]
+        return element.default[0] if kind == 'slider' else element.default
+
+    async def rerun(self, trigger=None):
+        """
+        Run the script with the current widget values, clicking the button trigger
+        (key or label) if given; returns the latency (s) and the bytes received.
+        Like the browser, a button of a fragment only reruns the fragment.
+        """
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        fragment_id = ''
+        for widget_id, (kind, element, value) in self.values.items():
+            state = message.rerun_script.widget_states.widgets.add(id=widget_id)
+            if kind == 'number_input':
+                if element.data_type == NumberInput.INT:
+                    state.int_value = int(value)
+                else:
+                    state.double_value = float(value)
+            elif kind == 'slider':
+                state.double_array_value.data.append(value)
+        if trigger is not None:
+            widget_id, _, _, fragment_id = self.widget(key=trigger) if trigger in PROFILE_BUTTONS else self.widget(label=trigger)
+            message.rerun_script.widget_states.widgets.add(id=widget_id, trigger_value=True)
+            message.rerun_script.fragment_id = fragment_id
+
+        start = time.perf_counter()
+        await self._connection.write_message(message.SerializeToString(), binary=True)
+        received = await asyncio.wait_for(self._read_run(fragment_id), self.timeout)
+        return time.perf_counter() - start, received
+
+    async def _read_run(self, fragment_id=''):
+        # A fragment run only redraws the elements of the fragment
+        widgets = {widget_id: widget for widget_id, widget in self.widgets.items() if fragment_id and widget[2] != fragment_id}
+        received, exception = 0, None
+        while True:
+            data = await self._connection.read_message()
+            if data is None:
+                raise SessionError("The server closed the connection")
+            received += len(data)
+            message = ForwardMsg.FromString(data)
+            if message.WhichOneof('type') == 'ref_hash':
+                message = self._cache[message.ref_hash]
+            elif message.metadata.cacheable:
+                self._cache[message.hash] = message
+
+            kind = message.WhichOneof('type')
+            if kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                element = message.delta.new_element
+                element_kind = element.WhichOneof('type')
+                if element_kind in WIDGET_TYPES:
+                    widget = getattr(element, element_kind)
+                    widgets[widget.id] = (element_kind, widget, message.delta.fragment_id)
+                elif element_kind == 'exception':
+                    exception = element.exception.message
+            elif kind == 'script_finished' and message.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+
+        self.widgets = widgets
+        # Widgets that disappeared, or whose identity changed with their arguments, lose their value
+        self.values = {widget_id: value for widget_id, value in self.values.items() if widget_id in widgets}
+        if exception is not None:
+            raise SessionError(exception)
+        return received
+
+
+
+def flow(session, rng):
+    """
+    One pass of the realistic flow, as a list of (interaction, coroutine function)
+    """
+    async def profile_form():
+        session.set_value(key='salary_input', value=rng.randrange(1500, 8000, 100))
+        session.set_value(key='age_input', value=rng.randrange(20, 55))
+        session.set_value(key='investment_perc_input', value=rng.randrange(5, 40))
+        return await session.rerun("Enregistrer votre profil")
+
+    async def parameter_form():
+        session.set_value(key='inflation_rate_input', value=rng.randrange(0, 5))
+        session.set_value(key='withdrawal_rate_input', value=rng.randrange(0, 6))
+        session.set_value(key='years_input', value=rng.randrange(5, 45))
+        return await session.rerun("Enregistrer vos paramètres")
+
+    async def profile_button():
+        enabled = [key for key in PROFILE_BUTTONS if not session.widget(key=key)[2].disabled]
+        return await session.rerun(rng.choice(enabled))
+
+    async def portfolio_form():
+        labels = [element.label for kind, element, _ in session.widgets.values()
+                  if kind == 'number_input' and element.label.endswith(' (%)')]
+        first, second = rng.sample(labels, 2)
+        # Move one point from one fund to another, keeping the total
+        shift = min(1.0, session.value(label=first))
+        session.set_value(label=first, value=round(session.value(label=first) - shift, 2))
+        session.set_value(label=second, value=round(session.value(label=second) + shift, 2))
+        return await session.rerun("Enregistrer votre portefeuille")
+
+    return [('profile_form', profile_form), ('parameter_form', parameter_form),
+            ('profile_button', profile_button), ('portfolio_form', portfolio_form)]
+
+
+
+async def run_session(session, rng, rounds, think_time, samples, errors):
+    interactions = [('first_render', session.rerun)]
+    for _ in range(rounds):
+        interactions += flow(session, rng)
+    for name, interaction in interactions:
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+        try:
+            latency, received = await interaction()
+        except (SessionError, asyncio.TimeoutError) as error:
+            errors.append(f"{name}: {error!r}")
+            continue
+        samples.append((name, latency, received))
+
+
+
+def rss_bytes(pid):
+    """
+    Resident set size of a process, in bytes (Linux), None when unavailable
+    """
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+
+async def load_test(url, sessions, rounds=3, think_time=0.0, server_pid=None):
+    """
+    Drive sessions concurrent sessions through rounds passes of the flow against the
+    server at url; returns the rerun latency percentiles (ms), the reruns per second,
+    the bytes received per rerun and the server RSS added per connected session
+    """
+    samples, errors = [], []
+    rss_before = rss_bytes(server_pid)
+    clients = [Session(url) for _ in range(sessions)]
+    # Every session is connected before the clock starts
+    await asyncio.gather(*(client.connect() for client in clients))
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(client, random.Random(i), rounds, think_time, samples, errors)
+                               for i, client in enumerate(clients)))
+        elapsed = time.perf_counter() - start
+        rss_after = rss_bytes(server_pid)
+    finally:
+        for client in clients:
+            client.close()
+
+    timings = np.array([latency for _, latency, _ in samples]) * 1000
+    p50, p95, p99 = np.percentile(timings, (50, 95, 99)) if len(timings) else (np.nan,) * 3
+    by_interaction = {}
+    for name, latency, received in samples:
+        by_interaction.setdefault(name, []).append((latency * 1000, received))
+    return {
+        'sessions': sessions,
+        'reruns': len(samples),
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'throughput': len(samples) / elapsed,
+        'rss_mb': None if rss_after is None else rss_after / 2**20,
+        'rss_per_session_mb': None if rss_after is None else (rss_after - rss_before) / sessions / 2**20,
+        'interactions': {name: {'p50_ms': float(np.percentile([latency for latency, _ in values], 50)),
+                                'p95_ms': float(np.percentile([latency for latency, _ in values], 95)),
+                                'kb': float(np.mean([received for _, received in values]) / 1024)}
+                         for name, values in by_interaction.items()},
+    }
+
+
+
+def slo_breaches(result, slos=DEFAULT_SLOS):
+    """
+    Descriptions of the SLOs breached by a load_test result
+    """
+    breaches = []
+    for name, limit in slos.items():
+        value = result[name]
+        if value is None:
+            continue
+        if value < limit if name == 'throughput' else value > limit:
+            breaches.append(f"{name} = {value:.1f} (limit {limit})")
+    return breaches
+
+
+
+def start_server(port=None, timeout=60):
+    """
+    Start the app on a free local port; returns the server process and its base URL
+    """
+    if port is None:
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP_PATH, '--server.headless', 'true', '--server.port', str(port),
+         '--server.address', '127.0.0.1', '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+        cwd=os.path.dirname(APP_PATH), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1) as response:
+                if response.status == 200:
+                    return server, f'ws://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"The Streamlit server did not start on port {port}")
+
+
+
+async def warm_up(url):
+    """
+    One first render, so that the measures exclude the imports of the first script run
+    """
+    session = Session(url)
+    await session.connect()
+    try:
+        await session.rerun()
+    finally:
+        session.close()
+
+
+
+def run_levels(session_counts, rounds=3, think_time=0.0, url=None, log=print):
+    """
+    load_test at each session count, against url or a server started for the run
+    """
+    server = None
+    if url is None:
+        server, url = start_server()
+    try:
+        asyncio.run(warm_up(url))
+        results = []
+        for sessions in session_counts:
+            result = asyncio.run(load_test(url, sessions, rounds, think_time, server.pid if server else None))
+            results.append(result)
+            rss = '' if result['rss_mb'] is None else f"   RSS {result['rss_mb']:7.1f} MB (+{result['rss_per_session_mb']:.2f} MB/session)"
+            log(f"{sessions:4d} sessions  p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+                f"p99 {result['p99_ms']:8.1f} ms  {result['throughput']:6.1f} reruns/s  {result['errors']} errors{rss}")
+        return results
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
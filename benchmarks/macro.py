@@ -0,0 +1,34 @@
+"""
+Macro-benchmarks: the simulator page rendered headlessly with Streamlit's AppTest.
+"""
+import os
+
+from streamlit.testing.v1 import AppTest
+
+from holdi.cache import simulation_cache
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+
+def benchmarks():
+    """
+    List of (name, function, rounds)
+    """
+    def first_render():
+        simulation_cache.clear()
+        AppTest.from_file(APP_PATH, default_timeout=60).run()
+
+    session = AppTest.from_file(APP_PATH, default_timeout=60)
+    session.run()
+
+    def toggle_monte_carlo():
+        simulation_cache.clear()
+        session.toggle(key="monte_carlo").set_value(not session.toggle(key="monte_carlo").value).run()
+
+    return [
+        ('page_simulator/first_render', first_render, 5),
+        ('page_simulator/rerun', session.run, 10),
+        ('page_simulator/monte_carlo_toggle', toggle_monte_carlo, 4),
+    ]
@@ -0,0 +1,91 @@
+"""
+Micro-benchmarks of the hot paths: data loading, allocation, weighted return and simulation.
+"""
+import numpy as np
+
+from holdi import allocation, assets, backtest, decumulation, engine, montecarlo, scenarios
+
+
+# (label, years) of the horizons benchmarked
+HORIZONS = [('small', 3), ('typical', 30), ('extreme', 50)]
+BATCH_SIZES = [1, 1000, 100000]
+
+
+
+def benchmarks():
+    """
+    List of (name, function, rounds)
+    """
+    assets_data = assets.get_asset_data()
+    asset_return = allocation.generate_asset_return(assets_data)
+    asset_allocation = allocation.generate_asset_allocation(assets_data, 30)
+    allocation_index = assets.get_allocation_index()
+
+    def cold_asset_records():
+        assets._snapshots.clear()
+        assets.get_asset_records()
+
+    def cold_asset_data():
+        assets._snapshots.clear()
+        assets._frames.clear()
+        assets.get_asset_data()
+
+    cases = [
+        ('get_asset_records/cold', cold_asset_records, 20),
+        ('query_asset_records', assets.query_asset_records, 20),
+        ('get_asset_data/cold', cold_asset_data, 20),
+        ('get_asset_data/cached', assets.get_asset_data, 20),
+        ('generate_asset_allocation', lambda: allocation.generate_asset_allocation(assets_data, 30, 'Profil Dynamique'), 20),
+        ('calculate_weighted_annual_return', lambda: allocation.calculate_weighted_annual_return(asset_return, asset_allocation), 20),
+        ('allocation_index/weighted_returns/100000', lambda: allocation_index.weighted_returns(
+            np.arange(100000) % 60 + 18, np.array(['Profil Prudent', 'Profil Équilibré', 'Profil Dynamique'])[np.arange(100000) % 3]), 10),
+    ]
+
+    for label, years in HORIZONS:
+        cases.append((f'simulate_investment/{label}', lambda years=years: engine.simulate_investment(
+            years, 425, 0.08, 425, 2, 4, 5), 20))
+        for batch_size in BATCH_SIZES[1:]:
+            returns = np.linspace(0.0, 0.2, batch_size)
+            cases.append((f'simulate_investment_batch/{label}/{batch_size}', lambda years=years, returns=returns: engine.simulate_investment_batch(
+                years, 425, returns, 425, 2, 4, 5), 10 if batch_size >= 100000 else 50))
+
+    # Net of fees: one set of rates per client, applied in the same pass
+    client_fees = assets.get_fee_schedule().portfolio_fees(
+        np.array(['Personne physique', 'Personne morale'])[np.arange(100000) % 2],
+        allocation_index.client_allocations(np.arange(100000) % 40 + 20, 'Profil Équilibré'))
+    net_returns = np.linspace(0.0, 0.2, 100000)
+    cases.append(('simulate_investment_batch/net/typical/100000', lambda: engine.simulate_investment_batch(
+        30, 425, net_returns, 425, 2, 4, 5, fees=client_fees), 10))
+
+    # Glide path: one return per (client, year), gathered from the precomputed table
+    ages = np.arange(100000) % 40 + 20
+    cases.append(('glide_path_returns/100000', lambda: allocation_index.glide_path_returns(ages, 'Profil Équilibré', 30), 10))
+    glide_returns = allocation_index.glide_path_returns(ages, 'Profil Équilibré', 30)
+    cases.append(('simulate_investment_batch/glide/typical/100000', lambda: engine.simulate_investment_batch(
+        30, 425, 0, 425, 2, 4, 5, annual_returns=glide_returns), 10))
+
+    cases.append(('simulate_investment_monte_carlo/typical/10000', lambda: montecarlo.simulate_investment_monte_carlo(
+        30, 425, 0.08, 0.07, 425, 2, 4, 5, n_paths=10000, seed=0), 5))
+    covariance = assets.get_asset_covariance()
+    fund_allocation = allocation_index.allocation(30, 'Profil Dynamique')
+    for rebalancing in montecarlo.REBALANCING:
+        cases.append((f'simulate_investment_multi_asset/{rebalancing}/typical/10000', lambda rebalancing=rebalancing: montecarlo.simulate_investment_multi_asset(
+            30, 425, fund_allocation, allocation_index.returns, covariance, 425, 2, 4, 5, rebalancing, n_paths=10000, seed=0), 3))
+    for target in decumulation.WITHDRAWAL_TARGETS:
+        cases.append((f'solve_withdrawal/{target}/typical/10000', lambda target=target: decumulation.solve_withdrawal(
+            50, 425, 0.06, 10000, 2, 25, 20000, target, annual_volatility=0.1, n_paths=10000, seed=0), 3))
+    # 60 years of synthetic monthly portfolio returns, replayed from every start month
+    history = np.random.default_rng(0).normal(0.006, 0.04, 720)
+    for label, years in HORIZONS:
+        cases.append((f'backtest_year_end_values/{label}/720', lambda years=years: backtest.backtest_year_end_values(
+            history, years, 425, 425, 2, 4, 5), 20))
+
+    # The most scenarios compared at once, a third of them following the glide path
+    compared = [{'name': str(i),
+                 'parameters': {'years': 10 + i % 40, 'monthly_amount': 425, 'initial_amount': 425, 'inflation_rate': 2,
+                                'withdrawal_rate': 4, 'years_until_withdrawal': 5, 'age': 20 + i,
+                                'investor_profile': 'Profil Équilibré', 'glide_path': i % 3 == 0},
+                 'allocation': dict(zip(allocation_index.funds, allocation_index.allocation(20 + i).tolist()))}
+                for i in range(scenarios.MAX_COMPARED)]
+    cases.append((f'evaluate_scenarios/{scenarios.MAX_COMPARED}', lambda: scenarios.evaluate_scenarios(compared, allocation_index), 20))
+    return cases
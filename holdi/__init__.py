@@ -0,0 +1,50 @@
+"""
+Core of the HOLDi simulator, shared by the Streamlit app and the headless tools.
+
+The core never imports Streamlit or Plotly, imports pandas only when the asset table is
+read, and does no I/O at import time. Its main functions are available from the package
+itself and are loaded on first access:
+
+    import holdi
+    holdi.simulate_investment_batch(30, 425, 0.08, 425, 2, 4, 5)
+"""
+import importlib
+
+
+# Public name -> module defining it
+_EXPORTS = {
+    'AllocationIndex': 'holdi.allocation',
+    'generate_asset_allocation': 'holdi.allocation',
+    'generate_asset_return': 'holdi.allocation',
+    'calculate_weighted_annual_return': 'holdi.allocation',
+    'FeeSchedule': 'holdi.fees',
+    'get_asset_data': 'holdi.assets',
+    'get_allocation_index': 'holdi.assets',
+    'get_fee_schedule': 'holdi.assets',
+    'simulate_investment': 'holdi.engine',
+    'simulate_investment_batch': 'holdi.engine',
+    'simulate_investment_monthly': 'holdi.engine',
+    'future_value_batch': 'holdi.engine',
+    'simulate_investment_monte_carlo': 'holdi.montecarlo',
+    'solve_monthly_amount': 'holdi.solver',
+    'solve_years': 'holdi.solver',
+    'solve_annual_return': 'holdi.solver',
+    'sweep_future_value': 'holdi.solver',
+    'solve_withdrawal': 'holdi.decumulation',
+}
+
+__all__ = list(_EXPORTS)
+
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'holdi' has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,190 @@
+"""
+Precomputed allocation and return matrices of the asset table.
+
+The asset table stores, for every fund, its return, the balanced allocation of each
+age bucket and the offsets of the prudent and dynamic profiles. AllocationIndex turns
+that into aligned NumPy arrays, so the weighted return of an (age, profile) pair is a
+lookup and the one of a custom allocation a dot product.
+"""
+from bisect import bisect_right
+
+import numpy as np
+
+
+AGE_COLUMNS = ['20 à 24 ans', '25 à 29 ans', '30 à 34 ans', '35 à 39 ans', '40 à 44 ans',
+               '45 à 49 ans', '50 à 54 ans', '55 à 59 ans', '60 à 64 ans', '65 ans et +']
+# First age of each bucket
+AGE_BUCKET_STARTS = [20, 25, 30, 35, 40, 45, 50, 55, 60, 65]
+
+PROFILES = ['Profil Prudent', 'Profil Équilibré', 'Profil Dynamique']
+# Column holding each profile's offset to the balanced allocation (None: no offset)
+PROFILE_OFFSET_COLUMNS = ['Profil Prudent', None, 'Profil Dynamique']
+DEFAULT_PROFILE = 'Profil Équilibré'
+
+
+
+def age_bucket(age):
+    """
+    Index in AGE_COLUMNS of the bucket of an age; ages below 20 fall in '65 ans et +'
+    """
+    bucket = bisect_right(AGE_BUCKET_STARTS, age) - 1
+    return bucket if bucket >= 0 else len(AGE_COLUMNS) - 1
+
+
+
+def age_buckets(ages):
+    """
+    Vectorized age_bucket
+    """
+    buckets = np.searchsorted(AGE_BUCKET_STARTS, np.asarray(ages), side='right') - 1
+    return np.where(buckets >= 0, buckets, len(AGE_COLUMNS) - 1)
+
+
+
+def profile_index(investor_profile):
+    """
+    Index in PROFILES of a profile; unknown profiles are balanced
+    """
+    if investor_profile in PROFILES:
+        return PROFILES.index(investor_profile)
+    return PROFILES.index(DEFAULT_PROFILE)
+
+
+
+def profile_indices(investor_profiles):
+    """
+    Vectorized profile_index
+    """
+    names, inverse = np.unique(np.asarray(investor_profiles, dtype=object).astype(str), return_inverse=True)
+    return np.array([profile_index(name) for name in names], dtype=int)[inverse]
+
+
+
+class AllocationIndex:
+    """
+    Read-only allocation tensor [age bucket x profile x fund] and return vector [fund]
+    """
+
+    def __init__(self, funds, returns, allocations):
+        self.funds = tuple(funds)
+        self.returns = returns
+        self.allocations = allocations
+        # Weighted annual return of every (age bucket, profile)
+        self.weighted_return_table = allocations @ returns
+        self._fund_positions = {fund: i for i, fund in enumerate(self.funds)}
+        for array in (self.returns, self.allocations, self.weighted_return_table):
+            array.flags.writeable = False
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build the index from the assets table (a DataFrame or the records of the binary snapshot),
+        with allocations rounded like generate_asset_allocation
+        """
+        balanced = np.stack([np.asarray(df[column], dtype=float) for column in AGE_COLUMNS])  # [age bucket x fund]
+        allocations = np.empty((len(AGE_COLUMNS), len(PROFILES), len(df)))
+        for p, offset_column in enumerate(PROFILE_OFFSET_COLUMNS):
+            offset = 0 if offset_column is None else np.asarray(df[offset_column], dtype=float)
+            allocations[:, p, :] = (balanced + offset).round(2)
+        return cls(np.asarray(df['FONDS PROPOSÉS A TERME']).tolist(), np.asarray(df['Taux'], dtype=float), allocations)
+
+    def allocation(self, age, investor_profile=DEFAULT_PROFILE):
+        """
+        Allocation vector of an age and investor profile (a read-only view)
+        """
+        return self.allocations[age_bucket(age), profile_index(investor_profile)]
+
+    def weighted_return(self, age, investor_profile=DEFAULT_PROFILE):
+        """
+        Weighted annual return of an age and investor profile
+        """
+        return float(self.weighted_return_table[age_bucket(age), profile_index(investor_profile)])
+
+    def weighted_returns(self, ages, investor_profiles):
+        """
+        Weighted annual returns of a batch of clients
+        """
+        return self.weighted_return_table[age_buckets(ages), profile_indices(investor_profiles)]
+
+    def client_allocations(self, ages, investor_profiles):
+        """
+        Allocation vectors of a batch of clients [client x fund]
+        """
+        return self.allocations[age_buckets(ages), profile_indices(investor_profiles)]
+
+    def glide_path_returns(self, ages, investor_profiles, years):
+        """
+        Weighted annual return of every simulated year [client x year], following the age
+        bucket reached each year with the same profile
+        """
+        ages = np.atleast_1d(np.asarray(ages, dtype=float))
+        profiles = np.broadcast_to(profile_indices(np.atleast_1d(investor_profiles)), ages.shape)
+        return self.weighted_return_table[age_buckets(ages[:, None] + np.arange(years)), profiles[:, None]]
+
+    def glide_path_allocations(self, age, investor_profile, years):
+        """
+        Allocation vector of every simulated year [year x fund], following the age bucket
+        reached each year with the same profile
+        """
+        return self.allocations[age_buckets(age + np.arange(years)), profile_index(investor_profile)]
+
+    def allocation_vector(self, asset_allocation):
+        """
+        Align a {fund: allocation} dictionary on the fund order of the index
+        """
+        vector = np.zeros(len(self.funds))
+        for asset, allocation in asset_allocation.items():
+            if asset not in self._fund_positions:
+                raise KeyError(f"Return data for {asset} not found")
+            vector[self._fund_positions[asset]] = allocation
+        return vector
+
+    def portfolio_returns(self, allocations):
+        """
+        Weighted annual return of one allocation vector [fund] or of a batch [client x fund]
+        """
+        return np.asarray(allocations, dtype=float) @ self.returns
+
+
+
+def generate_asset_allocation(df, age, investor_profile='Profil Équilibré'):
+    """
+    Build a dictionary with assets and their allocation according to age and investor profile
+    """
+    # Define age category based on the given age
+    age_col = AGE_COLUMNS[age_bucket(age)]
+
+    # The age column is the balanced allocation; the other profiles add their offsets to it.
+    # The shared asset table is only read, never written.
+    allocation = df[age_col].to_numpy()
+    if investor_profile == 'Profil Prudent':
+        allocation = allocation + df['Profil Prudent'].to_numpy()
+    elif investor_profile == 'Profil Dynamique':
+        allocation = allocation + df['Profil Dynamique'].to_numpy()
+
+    asset_allocation = dict(zip(df['FONDS PROPOSÉS A TERME'], allocation.round(2).tolist()))
+    return asset_allocation
+
+
+
+def generate_asset_return(df):
+    """
+    Generate a dictionary with assets : returns
+    """
+    asset_return = df.set_index('FONDS PROPOSÉS A TERME')['Taux'].to_dict()
+    return asset_return
+
+
+def calculate_weighted_annual_return(asset_return, custom_asset_allocation):
+    # Initialize the weighted return
+    weighted_annual_return = 0
+    # Calculate the weighted return
+    for asset, allocation in custom_asset_allocation.items():
+        if asset in asset_return:
+            # Add the product of allocation and return to the weighted return
+            weighted_annual_return += allocation * asset_return[asset]
+        else:
+            # Optionally handle assets not found in the return dictionary
+            raise KeyError(f"Return data for {asset} not found")
+    
+    return weighted_annual_return
@@ -0,0 +1,248 @@
+"""
+Process-wide access to the asset table (returns, risk ratings and allocations).
+
+The table lives in an imported module rather than in app.py because Streamlit
+re-executes app.py on every rerun, which would reset any cache defined there.
+
+ingest_assets.py writes the table into SQLite and, next to the database, a binary
+snapshot: a NumPy structured array that is memory-mapped in microseconds. The database
+is only queried when the snapshot is missing or older than it. The covariance matrix
+of the fund returns, used by the per-fund Monte Carlo model, and the fee schedule are
+read from the database.
+"""
+import os
+import threading
+
+import numpy as np
+
+from holdi.allocation import AGE_COLUMNS, AllocationIndex
+
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'investment_data.db')
+
+FUND_COLUMN = 'FONDS PROPOSÉS A TERME'
+# Columns of the asset table, in order, with their type in the snapshot
+ASSET_DTYPE = np.dtype([(FUND_COLUMN, 'U64'), ('Taux', 'f8'), ('Notation du risque', 'i8'),
+                        ('Profil Prudent', 'f8'), ('Profil Dynamique', 'f8')]
+                       + [(column, 'f8') for column in AGE_COLUMNS])
+
+_snapshots = {}
+_frames = {}
+_indexes = {}
+_covariances = {}
+_fee_schedules = {}
+_snapshots_lock = threading.Lock()
+
+
+
+def snapshot_path(db_path=DB_PATH):
+    """
+    Binary snapshot of the asset table written next to the database
+    """
+    return os.path.splitext(db_path)[0] + '.npy'
+
+
+
+def get_asset_version(db_path=DB_PATH):
+    """
+    Version of the asset table, changing whenever the database or its snapshot is rewritten
+    """
+    stat = os.stat(db_path)
+    try:
+        snapshot_mtime = os.stat(snapshot_path(db_path)).st_mtime_ns
+    except FileNotFoundError:
+        snapshot_mtime = None
+    return stat.st_mtime_ns, stat.st_size, snapshot_mtime
+
+
+
+def query_asset_records(db_path=DB_PATH):
+    """
+    Read the assets table through a read-only connection, as an array of ASSET_DTYPE records
+    """
+    # Imported here so that importing the core never pays for it
+    import sqlite3
+
+    columns = ', '.join(f'"{name}"' for name in ASSET_DTYPE.names)
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute(f"SELECT {columns} FROM assets_return_allocation").fetchall()
+    finally:
+        conn.close()
+    records = np.array(rows, dtype=ASSET_DTYPE)
+    records.flags.writeable = False
+    return records
+
+
+
+def write_snapshot(records, db_path=DB_PATH):
+    """
+    Write the binary snapshot atomically, so readers never map a partial file
+    """
+    path = snapshot_path(db_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(records, dtype=ASSET_DTYPE))
+    os.replace(tmp_path, path)
+
+
+
+def _read_asset_records(db_path, version):
+    """
+    Memory-map the snapshot when it is at least as recent as the database, else query the database
+    """
+    _, _, snapshot_mtime = version
+    if snapshot_mtime is not None and snapshot_mtime >= version[0]:
+        records = np.load(snapshot_path(db_path), mmap_mode='r')
+        if records.dtype == ASSET_DTYPE:
+            return records
+    return query_asset_records(db_path)
+
+
+
+def get_asset_records(db_path=DB_PATH):
+    """
+    Read-only records of the asset table (ASSET_DTYPE), shared by every session and
+    thread of the process and read once per version
+    """
+    version = get_asset_version(db_path)
+    snapshot = _snapshots.get(db_path)
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1]
+
+    with _snapshots_lock:
+        snapshot = _snapshots.get(db_path)
+        if snapshot is None or snapshot[0] != version:
+            snapshot = (version, _read_asset_records(db_path, version))
+            _snapshots[db_path] = snapshot
+        return snapshot[1]
+
+
+
+def get_asset_data(db_path=DB_PATH):
+    """
+    Snapshot of the DataBase with assets, return and allocation.
+
+    The columns are built once per database version as read-only arrays shared by every
+    session and thread of the process; each call returns its own shallow copy, so adding
+    or replacing a column stays local and writing a value in place raises.
+    """
+    import pandas as pd
+
+    version = get_asset_version(db_path)
+    cached = _frames.get(db_path)
+    if cached is None or cached[0] != version:
+        records = get_asset_records(db_path)
+        columns = {}
+        for name in ASSET_DTYPE.names:
+            column = records[name]
+            column = column.astype(object) if column.dtype.kind == 'U' else column.copy()
+            column.flags.writeable = False
+            columns[name] = column
+        cached = (version, pd.DataFrame(columns, copy=False))
+        _frames[db_path] = cached
+    return cached[1].copy(deep=False)
+
+
+
+def get_allocation_index(db_path=DB_PATH):
+    """
+    AllocationIndex of the current asset snapshot, built once per database version
+    """
+    version = get_asset_version(db_path)
+    cached = _indexes.get(db_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    index = AllocationIndex.from_frame(get_asset_records(db_path))
+    _indexes[db_path] = (version, index)
+    return index
+
+
+
+def query_asset_covariance(funds, db_path=DB_PATH):
+    """
+    Annual covariance matrix [fund x fund] of the latest asset version, in the order of
+    funds, None when the database holds no covariance (ingested before it was stored)
+    """
+    import sqlite3
+
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT fund_a, fund_b, covariance FROM asset_covariance "
+            "WHERE version = (SELECT MAX(version) FROM asset_versions)").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    if not rows:
+        return None
+
+    positions = {fund: i for i, fund in enumerate(funds)}
+    covariance = np.full((len(funds), len(funds)), np.nan)
+    for fund_a, fund_b, value in rows:
+        if fund_a in positions and fund_b in positions:
+            covariance[positions[fund_a], positions[fund_b]] = value
+    if np.isnan(covariance).any():
+        raise ValueError("The stored covariance matrix does not cover every fund of the asset table")
+    return covariance
+
+
+
+def get_asset_covariance(db_path=DB_PATH):
+    """
+    Read-only annual covariance matrix of the fund returns, in the fund order of the asset
+    table, read once per database version; derived from the risk ratings when none is stored
+    """
+    version = get_asset_version(db_path)
+    cached = _covariances.get(db_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    from holdi.montecarlo import covariance_from_ratings
+
+    records = get_asset_records(db_path)
+    covariance = query_asset_covariance(records[FUND_COLUMN].tolist(), db_path)
+    if covariance is None:
+        covariance = covariance_from_ratings(records['Notation du risque'])
+    covariance.flags.writeable = False
+    _covariances[db_path] = (version, covariance)
+    return covariance
+
+
+
+def query_fee_rows(db_path=DB_PATH):
+    """
+    (status, fund, entry_fee, management_fee, gains_tax) rows of the latest asset version,
+    empty when the database holds no fee schedule (ingested before it was stored)
+    """
+    import sqlite3
+
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        return conn.execute(
+            "SELECT status, fund, entry_fee, management_fee, gains_tax FROM asset_fees "
+            "WHERE version = (SELECT MAX(version) FROM asset_versions)").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+
+def get_fee_schedule(db_path=DB_PATH):
+    """
+    FeeSchedule of the funds of the asset table, read once per database version;
+    the default rates apply to the statuses and funds without a stored row
+    """
+    version = get_asset_version(db_path)
+    cached = _fee_schedules.get(db_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    from holdi.fees import FeeSchedule
+
+    schedule = FeeSchedule.from_rows(get_asset_records(db_path)[FUND_COLUMN].tolist(), query_fee_rows(db_path))
+    _fee_schedules[db_path] = (version, schedule)
+    return schedule
@@ -0,0 +1,155 @@
+"""
+Historical backtest: the investment plan replayed over every start month of real returns.
+
+Monthly returns per fund are read from a CSV file next to the database, with a `date`
+column followed by one column per fund (named like in the asset table). For a given
+allocation, rebalanced every month, the plan is replayed from every possible start
+month at once: the windows are strided views of the return series and each horizon is
+a closed-form sum over them, so there is no Python loop over windows or months.
+"""
+import os
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from holdi.assets import DB_PATH
+
+
+RETURNS_PATH = os.path.join(os.path.dirname(DB_PATH), 'monthly_returns.csv')
+
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+
+class ReturnHistory:
+    """
+    Read-only monthly returns [month x fund]; NaN before the first month of a fund
+    """
+
+    def __init__(self, months, funds, returns):
+        self.months = months
+        self.funds = tuple(funds)
+        self.returns = returns
+        self._fund_positions = {fund: i for i, fund in enumerate(self.funds)}
+        for array in (self.months, self.returns):
+            array.flags.writeable = False
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Read a CSV of monthly returns: a `date` column, then one column of decimal returns per fund
+        """
+        import pandas as pd
+
+        df = pd.read_csv(path)
+        if 'date' not in df.columns:
+            raise ValueError(f"{path} has no date column")
+        df = df.sort_values('date')
+        months = pd.to_datetime(df['date']).to_numpy().astype('datetime64[M]')
+        returns = df.drop(columns='date').apply(pd.to_numeric, errors='coerce')
+        if (returns <= -1).any().any():
+            raise ValueError(f"{path} has monthly returns of -100% or less")
+        return cls(months, returns.columns, returns.to_numpy(dtype=float))
+
+    def portfolio_returns(self, asset_allocation):
+        """
+        Months and monthly returns of a {fund: allocation} portfolio rebalanced every month,
+        over the longest period where every fund it holds has a return
+        """
+        held = [(self._fund_positions.get(asset), asset, allocation)
+                for asset, allocation in asset_allocation.items() if allocation != 0]
+        for position, asset, _ in held:
+            if position is None:
+                raise KeyError(f"Return history for {asset} not found")
+        positions = [position for position, _, _ in held]
+        weights = np.array([allocation for _, _, allocation in held])
+
+        available = ~np.isnan(self.returns[:, positions]).any(axis=1)
+        if not available.any():
+            return self.months[:0], np.zeros(0)
+        first = available.argmax()
+        last = len(available) - available[::-1].argmax()
+        if not available[first:last].all():
+            raise ValueError("The return history of a fund has gaps")
+        return self.months[first:last], self.returns[first:last, positions] @ weights
+
+
+
+def get_history_version(path=RETURNS_PATH):
+    """
+    Version of the return history file, changing whenever the file is rewritten
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+
+def get_return_history(path=RETURNS_PATH):
+    """
+    ReturnHistory of the CSV file, read once per file version and shared by every session
+    """
+    version = get_history_version(path)
+    cached = _histories.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _histories_lock:
+        cached = _histories.get(path)
+        if cached is None or cached[0] != version:
+            cached = (version, ReturnHistory.from_csv(path))
+            _histories[path] = cached
+        return cached[1]
+
+
+
+def backtest_year_end_values(monthly_returns, years, monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal):
+    """
+    Year-end portfolio values of the plan started at every possible month of a monthly
+    return series, shape (windows, years), with the contribution and withdrawal rules of
+    simulate_investment. Window s starts at month s of the series.
+    """
+    monthly_returns = np.asarray(monthly_returns, dtype=float)
+    years = int(years)
+    horizon = 12 * years
+    if len(monthly_returns) < horizon:
+        raise ValueError(f"{len(monthly_returns)} months of history, {horizon} needed")
+    windows = len(monthly_returns) - horizon + 1
+
+    contribution = monthly_amount * (1 + (inflation_rate / 100))
+    keep = 1 - (withdrawal_rate / 100 / 12)
+    # Month t of a window maps V -> k_t * (g * V + contribution), k_t = keep once withdrawals started
+    withdrawing = np.arange(horizon) >= 12 * np.ceil(years_until_withdrawal)
+    withdrawals_before = np.concatenate(([0], np.cumsum(withdrawing)))
+
+    # Growth over months [i, j) of the series is exp(log_growth[j] - log_growth[i])
+    log_growth = np.concatenate(([0.0], np.cumsum(np.log1p(monthly_returns))))
+    discount = np.exp(-log_growth)
+
+    # Value after h months of window s:
+    #   exp(log_growth[s+h]) * keep**W[h] * (initial * discount[s] + contribution * sum_{t<h} k_t * keep**-W[t+1] * discount[s+t+1])
+    # The sum is a cumulative sum along a [window x month] strided view of discount
+    weights = np.where(withdrawing, keep, 1.0) * keep ** -withdrawals_before[1:].astype(float)
+    contributions = np.cumsum(sliding_window_view(discount[1:], horizon) * weights, axis=1)
+
+    year_ends = np.arange(12, horizon + 1, 12)
+    starts = np.arange(windows)[:, None]
+    growth = np.exp(log_growth[starts + year_ends]) * keep ** withdrawals_before[year_ends].astype(float)
+    return growth * (initial_amount * discount[starts] + contribution * contributions[:, year_ends - 1])
+
+
+
+def backtest_outcomes(months, year_end_values):
+    """
+    Worst, median and best start month by final value, and the min/median/max of every year-end value
+    """
+    final_values = year_end_values[:, -1]
+    order = np.argsort(final_values)
+    outcomes = {
+        name: {'start': months[order[rank]], 'value': float(final_values[order[rank]])}
+        for name, rank in (('worst', 0), ('median', (len(order) - 1) // 2), ('best', -1))
+    }
+    outcomes['windows'] = len(order)
+    outcomes['bands'] = np.percentile(year_end_values, (0, 50, 100), axis=0)
+    return outcomes
@@ -0,0 +1,110 @@
+"""
+In-process memoization of simulation results, shared by every session.
+
+Like the asset snapshot, the cache lives in an imported module so that it survives
+Streamlit reruns and is shared by all the sessions served by one process.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+
+def canonical_key(*args, **kwargs):
+    """
+    Hashable key of simulation inputs: numbers are compared as floats (30 == 30.0),
+    dictionaries by sorted items and arrays by their values
+    """
+    def canonical(value):
+        if isinstance(value, bool) or value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return float(value)
+        if isinstance(value, dict):
+            return tuple(sorted((key, canonical(item)) for key, item in value.items()))
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return tuple(canonical(item) for item in value)
+        raise TypeError(f"Cannot build a cache key from {type(value).__name__}")
+
+    return canonical(args), canonical(kwargs)
+
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache whose entries also expire ttl seconds after being computed,
+    as measured by clock (time.monotonic by default)
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.compute_seconds = 0.0
+
+    def get_or_compute(self, key, compute):
+        """
+        Cached value of key, calling compute() on a miss; the value is shared, so never modify it
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+
+        # Compute outside the lock so other sessions are never blocked by a slow simulation
+        start = time.perf_counter()
+        value = compute()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.compute_seconds += elapsed
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Counters of the cache; saved_seconds estimates the compute time avoided by hits
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'compute_seconds': self.compute_seconds,
+                'saved_seconds': self.hits * self.compute_seconds / self.misses if self.misses else 0.0,
+            }
+
+
+
+# Projections of the simulator page (simulation results and chart)
+simulation_cache = ResultCache(maxsize=256, ttl=3600)
@@ -0,0 +1,190 @@
+"""
+Sustainable withdrawals: the largest withdrawal rate, or monthly income, that keeps the
+portfolio above a floor until the end of the horizon.
+
+Both targets are solved path by path on the monthly path model of holdi.montecarlo, a
+single deterministic path without volatility. The contributions stop when the withdrawals
+start (the retirement phase). A target level succeeds on a path when every
+month-end value of the withdrawal phase stays above the floor, and the success of a level
+decreases with it, so the largest level reached with a given probability is a quantile of
+the per-path maxima. The maximum income of a path is exact (the month-end values are affine
+in the income); the maximum rate is bisected on every path at once.
+"""
+import numpy as np
+
+from holdi.engine import NO_FEES, net_annual_return
+
+
+# Targets of solve_withdrawal
+WITHDRAWAL_TARGETS = ('withdrawal_rate', 'monthly_income')
+# Highest annual withdrawal rate searched, in %
+MAX_WITHDRAWAL_RATE = 100.0
+
+
+
+def _monthly_growth(rng, years, weighted_annual_return, annual_volatility, paths, annual_returns=None, management_fee=0.0, gains_tax=0.0):
+    """
+    Growth factors of every month [month x path]: lognormal like simulate_investment_monte_carlo,
+    or one deterministic path when annual_volatility is None
+    """
+    expected_returns = weighted_annual_return if annual_returns is None else np.asarray(annual_returns, dtype=float)[:years]
+    expected_returns = np.broadcast_to(net_annual_return(expected_returns, management_fee, gains_tax), (years,))
+    if annual_volatility is None:
+        return np.repeat((1 + expected_returns) ** (1 / 12), 12)[:, None]
+    monthly_volatility = annual_volatility / np.sqrt(12)
+    monthly_drift = np.repeat(np.log1p(expected_returns) / 12 - monthly_volatility ** 2 / 2, 12).astype(np.float32)
+    growth = rng.standard_normal((12 * years, paths), dtype=np.float32)
+    growth *= np.float32(monthly_volatility)
+    growth += monthly_drift[:, None]
+    return np.exp(growth, out=growth)
+
+
+
+def _max_monthly_income(start_value, growth, indexation, floor):
+    """
+    Largest first-year monthly income of every path keeping each month-end value above floor.
+
+    With P_t the growth over the first t months, the value after t months is
+    P_t * (V_0 - income * sum_{j<t} indexation_j / P_{j+1}), so each month bounds the
+    income and one pass gives the tightest bound. -inf where no income works.
+    """
+    products = np.ones_like(start_value)
+    incomes = np.zeros_like(start_value)
+    best = np.full_like(start_value, np.inf)
+    for m in range(len(growth)):
+        products *= growth[m]
+        incomes += indexation[m] / products
+        np.minimum(best, (start_value - floor / products) / incomes, out=best)
+    return np.where(best >= 0, best, -np.inf)
+
+
+
+def _stays_above(start_value, growth, keep, floor):
+    """
+    Whether every month-end value of the withdrawal phase stays above floor, with the keep
+    factor (one per path) of a withdrawal rate
+    """
+    value = start_value.copy()
+    above = np.ones(value.shape, dtype=bool)
+    for m in range(len(growth)):
+        value *= growth[m]
+        value *= keep
+        above &= value >= floor
+    return above
+
+
+
+def _max_withdrawal_rate(start_value, growth, floor, tolerance):
+    """
+    Largest annual withdrawal rate (%) of every path keeping each month-end value above floor,
+    bisected on all paths together; -inf where even no withdrawal fails, +inf where even
+    MAX_WITHDRAWAL_RATE does not bring the value below the floor (no rate is binding)
+    """
+    low = np.zeros_like(start_value)
+    high = np.full_like(start_value, MAX_WITHDRAWAL_RATE)
+    feasible = _stays_above(start_value, growth, 1.0, floor)
+    at_maximum = _stays_above(start_value, growth, 1 - MAX_WITHDRAWAL_RATE / 1200, floor)
+    # With a zero floor a share of the value never empties the portfolio: nothing to bisect
+    for _ in range(int(np.ceil(np.log2(MAX_WITHDRAWAL_RATE / tolerance))) if (feasible & ~at_maximum).any() else 0):
+        middle = (low + high) / 2
+        above = _stays_above(start_value, growth, 1 - middle / 1200, floor)
+        low = np.where(above, middle, low)
+        high = np.where(above, high, middle)
+    return np.where(at_maximum, np.inf, np.where(feasible, low, -np.inf))
+
+
+
+def _annual_withdrawals(start_value, growth, target, level, indexation, basis=0.0, exit_tax=0.0):
+    """
+    Amount withdrawn every year of the withdrawal phase [path x year] at a target level, net of
+    the tax at realization on the share of the gain over the tax basis that every withdrawal sells;
+    basis is the tax basis at the start
+    """
+    value = start_value.copy()
+    basis = np.full_like(value, basis)
+    withdrawals = np.zeros((len(value), len(growth) // 12))
+    keep = 1 - level / 1200
+    for m in range(len(growth)):
+        value *= growth[m]
+        withdrawal = value * (1 - keep) if target == 'withdrawal_rate' else np.full_like(value, level * indexation[m])
+        sold = np.clip(np.divide(withdrawal, value, out=np.ones_like(value), where=value > 0), 0, 1)
+        withdrawals[:, m // 12] += withdrawal - exit_tax * sold * np.maximum(value - basis, 0)
+        basis *= 1 - sold
+        value -= withdrawal
+    return withdrawals
+
+
+
+def solve_withdrawal(years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, years_until_withdrawal, floor=0.0,
+                     target='withdrawal_rate', annual_volatility=None, success_probability=0.9, n_paths=10000,
+                     percentiles=(5, 50, 95), chunk_size=10000, seed=None, annual_returns=None, tolerance=1e-3, fees=None):
+    """
+    Largest annual withdrawal rate (%), or first-year monthly income (€), keeping the portfolio
+    above floor at every month-end from the first withdrawal until the end of `years`.
+
+    The rate follows simulate_investment (a share of the value every month); the income is a
+    fixed monthly amount raised by inflation_rate every year after the first. The monthly
+    contributions stop when the withdrawals start.
+    Without annual_volatility the projection is deterministic; with it, the level holds on at
+    least success_probability of n_paths lognormal paths, simulated in chunks of chunk_size.
+    fees are the fee rates of simulate_investment_monte_carlo; the income is net of the tax at
+    realization, the solved level is the amount withdrawn before it.
+
+    Returns the solved 'level' (NaN where no level works), whether the rate is 'unbounded'
+    (every rate up to MAX_WITHDRAWAL_RATE keeps the value above the floor, as a share of the
+    value never empties the portfolio with a zero floor; the level is then NaN), the share of
+    paths where it holds ('success_probability') and the percentiles of the amount withdrawn
+    every year ('income', shape (len(percentiles), years), zero before the withdrawals).
+    """
+    if target not in WITHDRAWAL_TARGETS:
+        raise ValueError(f"target must be one of {', '.join(WITHDRAWAL_TARGETS)}")
+    years = int(years)
+    switch = 12 * int(np.ceil(years_until_withdrawal))
+    if switch >= 12 * years:
+        raise ValueError("The withdrawals must start before the end of the horizon")
+    if annual_volatility is None:
+        n_paths = chunk_size = 1
+    entry_fee, management_fee, gains_tax, exit_tax = NO_FEES if fees is None else fees
+    paid = monthly_amount * (1 + (inflation_rate / 100))
+    contribution = paid * (1 - entry_fee)
+    no_income = np.zeros((len(percentiles), years))
+    # Income of every withdrawal month relative to the first year
+    indexation = (1 + inflation_rate / 100) ** (np.arange(12 * years - switch) // 12)
+    # The draws are generated twice, for the levels and for the income schedule
+    seed = np.random.SeedSequence(seed)
+
+    def chunks():
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_paths, chunk_size):
+            paths = min(chunk_size, n_paths - start)
+            growth = _monthly_growth(rng, years, weighted_annual_return, annual_volatility, paths, annual_returns, management_fee, gains_tax)
+            value = np.full(paths, initial_amount * (1 - entry_fee))
+            for m in range(switch):
+                value *= growth[m]
+                value += contribution
+            yield slice(start, start + paths), value, growth[switch:]
+
+    levels = np.empty(n_paths)
+    for paths, value, growth in chunks():
+        if target == 'monthly_income':
+            levels[paths] = _max_monthly_income(value, growth, indexation, floor)
+        else:
+            levels[paths] = _max_withdrawal_rate(value, growth, floor, tolerance)
+
+    # The largest level reached by at least success_probability of the paths
+    level = np.quantile(levels, 1 - success_probability, method='lower') if annual_volatility is not None else levels[0]
+    if level == np.inf:
+        return {'level': np.nan, 'unbounded': True, 'success_probability': float(np.mean(levels == np.inf)), 'income': no_income}
+    if not np.isfinite(level):
+        return {'level': np.nan, 'unbounded': False, 'success_probability': 0.0, 'income': no_income}
+
+    withdrawals = np.zeros((n_paths, years))
+    for paths, value, growth in chunks():
+        withdrawals[paths, switch // 12:] = _annual_withdrawals(value, growth, target, level, indexation,
+                                                                initial_amount + switch * paid, exit_tax)
+    return {
+        'level': float(level),
+        'unbounded': False,
+        'success_probability': float(np.mean(levels >= level)),
+        'income': np.percentile(withdrawals, percentiles, axis=0),
+    }
@@ -0,0 +1,98 @@
+"""
+Fee and tax schedule: entry fee, annual management fee and tax on gains, per status and per fund.
+
+The rates of a portfolio are the averages of its funds' rates weighted by the allocation,
+and the simulations apply them inside their monthly maps (see holdi.engine). Entry fees
+are taken from every amount invested and management fees from the value every month.
+The tax on gains follows the mode of the status: individuals pay it when the gains are
+realized (on the gain over the amounts paid in, at the horizon and on every withdrawal),
+companies every year on the positive return of the year.
+"""
+import numpy as np
+
+
+# Statuses of the profile form
+STATUSES = ('Personne physique', 'Personne morale')
+DEFAULT_STATUS = 'Personne physique'
+# Rates of the schedule, in order, as decimals (0.01 = 1%)
+FEE_RATES = ('entry_fee', 'management_fee', 'gains_tax')
+# Rates of a portfolio given to the simulations: the tax on gains is split by mode into
+# gains_tax (paid every year) and exit_tax (paid when the gains are realized)
+PORTFOLIO_FEES = ('entry_fee', 'management_fee', 'gains_tax', 'exit_tax')
+# When the tax on gains is paid
+TAX_MODES = ('realization', 'annual')
+DEFAULT_TAX_MODES = {
+    'Personne physique': 'realization',
+    'Personne morale': 'annual',
+}
+# Rates used for every fund without a fee sheet: flat tax for individuals, corporate tax for companies
+DEFAULT_RATES = {
+    'Personne physique': (0.0, 0.0, 0.30),
+    'Personne morale': (0.0, 0.0, 0.25),
+}
+
+
+
+def status_indices(statuses):
+    """
+    Index in STATUSES of a status or of an array of statuses
+    """
+    statuses = np.asarray(statuses)
+    indices = np.full(statuses.shape, -1)
+    for i, status in enumerate(STATUSES):
+        indices[statuses == status] = i
+    if (indices < 0).any():
+        unknown = sorted(set(np.atleast_1d(statuses)[np.atleast_1d(indices) < 0].tolist()))
+        raise KeyError(f"Unknown status: {', '.join(map(str, unknown))}")
+    return indices
+
+
+
+class FeeSchedule:
+    """
+    Read-only rates [status x fund x rate] of the funds of the asset table, and the tax mode
+    of every status
+    """
+
+    def __init__(self, funds, rates, tax_modes=None):
+        self.funds = tuple(funds)
+        self.rates = rates
+        self.rates.flags.writeable = False
+        self.tax_modes = tuple(DEFAULT_TAX_MODES[status] for status in STATUSES) if tax_modes is None else tuple(tax_modes)
+        if set(self.tax_modes) - set(TAX_MODES):
+            raise ValueError(f"tax modes must be among {', '.join(TAX_MODES)}")
+        self._realization = np.array([mode == 'realization' for mode in self.tax_modes])
+
+    @classmethod
+    def default(cls, funds):
+        """
+        DEFAULT_RATES for every fund
+        """
+        rates = np.array([[DEFAULT_RATES[status]] * len(funds) for status in STATUSES], dtype=float).reshape(len(STATUSES), len(funds), len(FEE_RATES))
+        return cls(funds, rates)
+
+    @classmethod
+    def from_rows(cls, funds, rows):
+        """
+        Schedule of (status, fund, *FEE_RATES) rows; funds or statuses without a row keep DEFAULT_RATES
+        """
+        schedule = cls.default(funds)
+        rates = schedule.rates.copy()
+        positions = {fund: i for i, fund in enumerate(funds)}
+        for status, fund, *values in rows:
+            if status in STATUSES and fund in positions:
+                rates[STATUSES.index(status), positions[fund]] = values
+        return cls(funds, rates)
+
+    def portfolio_fees(self, statuses, allocations):
+        """
+        PORTFOLIO_FEES (entry_fee, management_fee, gains_tax, exit_tax) of one allocation vector
+        [fund] or of a batch [client x fund], with one status or one per client
+        """
+        allocations = np.asarray(allocations, dtype=float)
+        totals = allocations.sum(axis=-1, keepdims=True)
+        weights = np.divide(allocations, totals, out=np.zeros_like(allocations), where=totals > 0)
+        indices = status_indices(statuses)
+        entry_fee, management_fee, tax = np.moveaxis(np.einsum('...f,...fr->...r', weights, self.rates[indices]), -1, 0)
+        realization = self._realization[indices]
+        return entry_fee, management_fee, np.where(realization, 0.0, tax), np.where(realization, tax, 0.0)
@@ -0,0 +1,167 @@
+"""
+Lightweight timing of the stages of each rerun (data loading, allocation, simulation, chart...).
+
+Durations are aggregated in process-wide histograms, exported in the Prometheus text
+format, and each rerun can also be appended as one JSON line to the file named by
+the HOLDI_TIMING_LOG environment variable.
+"""
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Upper bounds (seconds) of the histogram buckets, as in Prometheus' defaults
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+
+class StageHistogram:
+    """
+    Latency histogram of one stage
+    """
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.bucket_counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Quantile estimated by linear interpolation inside the histogram buckets
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.bucket_counts):
+            if count and cumulative + count >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+        return self.max
+
+
+
+class StageTimings:
+    """
+    Process-wide histograms of stage durations, shared by every session
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._histograms = {}
+        self._lock = threading.Lock()
+        # Streamlit runs each session's script in its own thread
+        self._local = threading.local()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._histograms.setdefault(stage, StageHistogram()).observe(seconds)
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            record[stage] = record.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Time the enclosed block as one occurrence of stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def rerun(self, stage='rerun', **labels):
+        """
+        Time a whole rerun as stage and log its stages as one JSON line. A rerun started
+        inside another one, like a fragment during a full rerun, is part of the outer one.
+        """
+        if getattr(self._local, 'record', None) is not None:
+            yield
+            return
+        self._local.record = {}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+            record, self._local.record = self._local.record, None
+            if self.log_path:
+                line = json.dumps({'time': time.time(), **labels, 'stages': record})
+                with self._lock, open(self.log_path, 'a') as f:
+                    f.write(line + '\n')
+
+    def summary(self):
+        """
+        One row per stage: count, mean, estimated p50/p95 and max, in milliseconds
+        """
+        with self._lock:
+            return [{
+                'stage': stage,
+                'count': histogram.count,
+                'mean_ms': 1000 * histogram.sum / histogram.count,
+                'p50_ms': 1000 * histogram.quantile(0.5),
+                'p95_ms': 1000 * histogram.quantile(0.95),
+                'max_ms': 1000 * histogram.max,
+            } for stage, histogram in sorted(self._histograms.items())]
+
+    def prometheus_text(self, name='holdi_stage_seconds'):
+        """
+        Histograms in the Prometheus text exposition format
+        """
+        lines = [f"# HELP {name} Duration of the stages of a simulator rerun.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+
+stage_timings = StageTimings(log_path=os.environ.get('HOLDI_TIMING_LOG'))
+span = stage_timings.span
+
+
+
+def profile_call(function, limit=40):
+    """
+    Run function under cProfile and return the statistics of its slowest calls as text
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        function()
+    finally:
+        profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
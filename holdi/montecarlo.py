@@ -0,0 +1,253 @@
+"""
+Stochastic projection of an investment plan (Monte Carlo percentile bands).
+
+The aggregated model draws one return for the whole portfolio, whose volatility is
+derived from the risk ratings of the funds with the same correlation between every
+pair. The per-fund model draws the returns of all the funds jointly from a covariance
+matrix and follows the holdings of each fund, so diversification and rebalancing count.
+Both read their percentiles from per-year histograms filled chunk by chunk, so memory does
+not grow with the number of paths.
+"""
+import numpy as np
+
+from holdi.engine import NO_FEES, invested_basis, net_annual_return, net_of_exit_tax
+
+
+# Annual volatility assumed for each "Notation du risque" (1 = lowest risk, 5 = highest)
+RISK_VOLATILITY = {1: 0.02, 2: 0.05, 3: 0.10, 4: 0.15, 5: 0.25}
+# Correlation assumed between any two funds
+RISK_CORRELATION = 0.3
+# How often the per-fund model brings the holdings back to the target allocation
+REBALANCING = ('monthly', 'yearly', 'never')
+# Relative width of the histogram bins of the percentiles, and range of the binned values (€)
+QUANTILE_RELATIVE_WIDTH = 2e-3
+QUANTILE_RANGE = (1.0, 1e13)
+
+
+
+def generate_asset_volatility(df):
+    """
+    Generate a dictionary with assets : annual volatility, mapped from their risk rating
+    """
+    return dict(zip(df['FONDS PROPOSÉS A TERME'], df['Notation du risque'].map(RISK_VOLATILITY)))
+
+
+
+def calculate_portfolio_volatility(asset_volatility, custom_asset_allocation, correlation=RISK_CORRELATION):
+    """
+    Annual volatility of the portfolio, with the same correlation between every pair of funds
+    """
+    exposures = []
+    for asset, allocation in custom_asset_allocation.items():
+        if asset not in asset_volatility:
+            raise KeyError(f"Volatility data for {asset} not found")
+        exposures.append(allocation * asset_volatility[asset])
+    exposures = np.array(exposures)
+    variance = (1 - correlation) * np.sum(exposures ** 2) + correlation * np.sum(exposures) ** 2
+    return float(np.sqrt(variance))
+
+
+
+def covariance_from_ratings(ratings, correlation=RISK_CORRELATION):
+    """
+    Annual covariance matrix [fund x fund] implied by the risk ratings, with the same
+    correlation between every pair of funds (the model of calculate_portfolio_volatility)
+    """
+    volatility = np.array([RISK_VOLATILITY[int(rating)] for rating in ratings])
+    correlations = np.full((len(volatility), len(volatility)), correlation)
+    np.fill_diagonal(correlations, 1.0)
+    return correlations * np.outer(volatility, volatility)
+
+
+
+def covariance_factor(covariance):
+    """
+    Lower triangular L with L @ L.T == covariance; positive semi-definite matrices (a fund
+    without volatility) fall back to the eigendecomposition
+    """
+    try:
+        return np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        if eigenvalues.min() < -1e-10 * max(eigenvalues.max(), 1e-300):
+            raise ValueError("The covariance matrix is not positive semi-definite")
+        return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+
+
+class QuantileHistogram:
+    """
+    Streaming percentiles of the values of several columns (one per year): counts of
+    log-spaced bins of relative width QUANTILE_RELATIVE_WIDTH, so memory does not depend on
+    the number of values and the percentiles of values in QUANTILE_RANGE are within half a
+    bin of the exact ones. Values below the range count as 0, values above it as its end.
+    """
+
+    def __init__(self, columns, relative_width=QUANTILE_RELATIVE_WIDTH, value_range=QUANTILE_RANGE):
+        self.log_width = np.log1p(relative_width)
+        self.log_low = np.log(value_range[0])
+        # Bin 0 holds the values below the range, the last bin the values above it
+        self.bins = int(np.ceil((np.log(value_range[1]) - self.log_low) / self.log_width)) + 2
+        self.counts = np.zeros((columns, self.bins), dtype=np.int64)
+        centers = np.exp(self.log_low + (np.arange(self.bins - 2) + 0.5) * self.log_width)
+        self.values = np.concatenate(([0.0], centers, [value_range[1]]))
+
+    def add(self, column, values):
+        """
+        Count values in the histogram of a column
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            positions = (np.log(np.asarray(values, dtype=np.float64)) - self.log_low) / self.log_width + 1
+        positions = np.clip(np.nan_to_num(positions, nan=0.0, neginf=0.0, posinf=self.bins - 1), 0, self.bins - 1)
+        self.counts[column] += np.bincount(positions.astype(np.int64), minlength=self.bins)
+
+    def percentiles(self, percentiles):
+        """
+        Percentiles of every column [percentile x column], interpolated between the ranks
+        like np.percentile
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        ranks = (cumulative[:, -1:] - 1) * np.asarray(percentiles, dtype=float)[None, :] / 100
+        result = np.empty((len(percentiles), len(self.counts)))
+        for column, (counts, column_ranks) in enumerate(zip(cumulative, ranks)):
+            below, above = (self.values[np.searchsorted(counts, rank, side='right')] for rank in (np.floor(column_ranks), np.ceil(column_ranks)))
+            result[:, column] = below + (above - below) * (column_ranks - np.floor(column_ranks))
+        return result
+
+
+
+def simulate_investment_monte_carlo(years, monthly_amount, weighted_annual_return, annual_volatility, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                                    n_paths=10000, percentiles=(5, 50, 95), chunk_size=10000, seed=None, annual_returns=None, fees=None):
+    """
+    Stochastic simulate_investment: monthly returns are lognormal with the given annual volatility,
+    and an expected annual return of weighted_annual_return.
+
+    Paths are simulated in chunks of chunk_size, each chunk month by month, and the year-end values
+    of every chunk are counted in a QuantileHistogram, so memory is bounded by chunk_size * 12 plus
+    the histogram bins of every year, whatever the number of paths and months.
+    Returns the timeline (years + 1,) and the percentiles of the portfolio value at the end of each
+    year, shape (len(percentiles), years), aligned with the arrays of simulate_investment.
+    annual_returns optionally gives the expected return of every year (a glide path).
+    fees are the fee rates of simulate_investment_batch, the yearly tax applying to the expected
+    return.
+    """
+    rng = np.random.default_rng(seed)
+    timeline = np.arange(years + 1)
+    entry_fee, management_fee, gains_tax, exit_tax = NO_FEES if fees is None else fees
+
+    monthly_volatility = annual_volatility / np.sqrt(12)
+    expected_returns = weighted_annual_return if annual_returns is None else np.asarray(annual_returns, dtype=float)[:years]
+    expected_returns = net_annual_return(expected_returns, management_fee, gains_tax)
+    monthly_drift = np.broadcast_to(np.log(1 + expected_returns) / 12 - monthly_volatility ** 2 / 2, (years,))
+    contribution = monthly_amount * (1 + (inflation_rate / 100)) * (1 - entry_fee)
+    keep = 1 - (withdrawal_rate / 100 / 12)
+
+    year_end_values = QuantileHistogram(years)
+    for start in range(0, n_paths, chunk_size):
+        stop = min(start + chunk_size, n_paths)
+        total_value = np.full(stop - start, initial_amount * (1 - entry_fee), dtype=float)
+        for y in range(years):
+            growth = np.exp(rng.normal(monthly_drift[y], monthly_volatility, size=(12, stop - start)))
+            for m in range(12):
+                total_value *= growth[m]
+                total_value += contribution
+                if y >= years_until_withdrawal:
+                    total_value *= keep
+            year_end_values.add(y, total_value)
+
+    return timeline, _net_percentiles(year_end_values.percentiles(percentiles), years, monthly_amount, initial_amount,
+                                      inflation_rate, withdrawal_rate, years_until_withdrawal, exit_tax)
+
+
+
+def _net_percentiles(values, years, monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal, exit_tax):
+    """
+    Percentiles of the year-end values [percentile x year] after the tax at realization; the
+    tax basis is the same on every path and the net value increases with the value, so the
+    percentiles of the net values are the net percentiles
+    """
+    if not exit_tax:
+        return values
+    basis = invested_basis(12 * np.arange(1, years + 1), monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal)
+    return net_of_exit_tax(values, basis, exit_tax)
+
+
+
+def simulate_investment_multi_asset(years, monthly_amount, allocation, fund_returns, covariance, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                                    rebalancing='monthly', n_paths=10000, percentiles=(5, 50, 95), chunk_size=10000, seed=None, fees=None):
+    """
+    Stochastic simulate_investment with one return per fund: monthly log returns are drawn
+    jointly from the annual covariance matrix [fund x fund] of the log returns, through its
+    Cholesky factor, with expected annual returns fund_returns [fund].
+
+    allocation is the target allocation [fund], or one target per year [year x fund] (a glide
+    path). Contributions are invested along the target, withdrawals sell every fund pro rata,
+    and the holdings are brought back to the target every month, at the start of every year,
+    or never (see REBALANCING). Funds absent from every target are not simulated, and the share
+    of a target left unallocated is held as cash at a 0 return, as in the weighted return of the
+    deterministic and aggregated models.
+
+    Paths are simulated in chunks of chunk_size, one year of draws [month x path x fund] at a
+    time, and the year-end values are counted in a QuantileHistogram, so memory is bounded by
+    12 * chunk_size * funds plus the histogram bins whatever the number of paths and months. Returns the timeline and percentiles like simulate_investment_monte_carlo.
+    fees are the portfolio fee rates of simulate_investment_batch, applied to every fund.
+    """
+    if rebalancing not in REBALANCING:
+        raise ValueError(f"rebalancing must be one of {', '.join(REBALANCING)}")
+    rng = np.random.default_rng(seed)
+    timeline = np.arange(years + 1)
+
+    entry_fee, management_fee, gains_tax, exit_tax = NO_FEES if fees is None else fees
+    fund_returns = np.asarray(fund_returns, dtype=float)
+    targets = np.asarray(allocation, dtype=float)
+    targets = np.broadcast_to(targets if targets.ndim == 1 else targets[:years], (years, len(fund_returns)))
+    # The held funds follow the law given by their sub-matrix, the others are not drawn
+    held = np.flatnonzero((targets != 0).any(axis=0))
+    targets = targets[:, held]
+    cash = 1 - targets.sum(axis=1)
+    cash_growth = (1 + net_annual_return(0.0, management_fee, gains_tax)) ** (1 / 12)
+    monthly_covariance = np.asarray(covariance, dtype=float)[np.ix_(held, held)] / 12
+    factor_t = covariance_factor(monthly_covariance).T.astype(np.float32)
+    monthly_drift = (np.log1p(net_annual_return(fund_returns[held], management_fee, gains_tax)) / 12 - np.diag(monthly_covariance) / 2).astype(np.float32)
+    contribution = monthly_amount * (1 + (inflation_rate / 100)) * (1 - entry_fee)
+    keep = 1 - (withdrawal_rate / 100 / 12)
+
+    year_end_values = QuantileHistogram(years)
+    for start in range(0, n_paths, chunk_size):
+        stop = min(start + chunk_size, n_paths)
+        total_value = np.full(stop - start, initial_amount * (1 - entry_fee), dtype=float)
+        # Holdings [path x fund]; rebalanced every month, the total value is enough
+        holdings = None if rebalancing == 'monthly' else np.outer(total_value, targets[0])
+        cash_holdings = None if holdings is None else total_value * cash[0]
+        for y in range(years):
+            if rebalancing == 'yearly' and y > 0:
+                holdings = np.outer(total_value, targets[y])
+                cash_holdings = total_value * cash[y]
+            # Growth factors of every fund over each month of the year, correlated through the factor
+            growth = rng.standard_normal((12, stop - start, len(held)), dtype=np.float32) @ factor_t
+            growth += monthly_drift
+            np.exp(growth, out=growth)
+            withdrawing = y >= years_until_withdrawal
+
+            if holdings is None:
+                portfolio_growth = growth @ targets[y].astype(np.float32) + np.float32(cash[y] * cash_growth)
+                for m in range(12):
+                    total_value *= portfolio_growth[m]
+                    total_value += contribution
+                    if withdrawing:
+                        total_value *= keep
+            else:
+                invested = contribution * targets[y]
+                for m in range(12):
+                    holdings *= growth[m]
+                    holdings += invested
+                    cash_holdings *= cash_growth
+                    cash_holdings += contribution * cash[y]
+                    if withdrawing:
+                        holdings *= keep
+                        cash_holdings *= keep
+                total_value = holdings.sum(axis=1) + cash_holdings
+            year_end_values.add(y, total_value)
+
+    return timeline, _net_percentiles(year_end_values.percentiles(percentiles), years, monthly_amount, initial_amount,
+                                      inflation_rate, withdrawal_rate, years_until_withdrawal, exit_tax)
@@ -0,0 +1,206 @@
+"""
+Named scenarios (parameters + allocation) saved by the users, and their batched comparison.
+
+Scenarios live in their own SQLite database rather than in the asset database, whose
+modification time versions the asset table and the caches built on it. Every access
+goes through a small pool of long-lived connections shared by the sessions of the process.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+from holdi.assets import DB_PATH
+from holdi.engine import simulate_investment_batch
+from holdi.fees import DEFAULT_STATUS
+
+
+SCENARIOS_PATH = os.path.join(os.path.dirname(DB_PATH), 'scenarios.db')
+# Parameters of simulate_investment saved with each scenario, besides the allocation
+SCENARIO_PARAMETERS = ('years', 'monthly_amount', 'initial_amount', 'inflation_rate', 'withdrawal_rate', 'years_until_withdrawal')
+# Most scenarios compared at once
+MAX_COMPARED = 50
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workspace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    allocation TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    UNIQUE (workspace, name)
+);
+CREATE INDEX IF NOT EXISTS scenarios_workspace_updated ON scenarios (workspace, updated_at);
+'''
+
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of at most size SQLite connections to one database, opened on first use
+    """
+
+    def __init__(self, path, size=4, setup=None):
+        self.path = path
+        self.size = size
+        self._setup = setup
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        # Readers never wait for a writer
+        conn.execute("PRAGMA journal_mode=WAL")
+        if self._setup is not None:
+            self._setup(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection, waiting for one to be returned when size are in use
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        """
+        Close the idle connections
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+
+class ScenarioStore:
+    """
+    Scenarios of every workspace, a workspace being the saved scenarios of one visitor
+    """
+
+    def __init__(self, path=SCENARIOS_PATH, pool_size=4):
+        self.pool = ConnectionPool(path, pool_size, setup=lambda conn: conn.executescript(SCHEMA))
+
+    def save(self, workspace, name, parameters, allocation):
+        """
+        Save a scenario, replacing the one of the same name in the workspace
+        """
+        with self.pool.connection() as conn, conn:
+            conn.execute(
+                "INSERT INTO scenarios (workspace, name, parameters, allocation, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (workspace, name) DO UPDATE SET parameters = excluded.parameters, "
+                "allocation = excluded.allocation, updated_at = excluded.updated_at",
+                (workspace, name, json.dumps(parameters), json.dumps(allocation),
+                 datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+    def names(self, workspace):
+        """
+        Names of the scenarios of a workspace, most recently saved first
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT name FROM scenarios WHERE workspace = ? ORDER BY updated_at DESC, id DESC",
+                                (workspace,)).fetchall()
+        return [name for name, in rows]
+
+    def load(self, workspace, names):
+        """
+        Scenarios of a workspace, as {'name', 'parameters', 'allocation'} dictionaries in the order of names
+        """
+        names = list(names)
+        if not names:
+            return []
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT name, parameters, allocation FROM scenarios WHERE workspace = ? AND name IN ({', '.join('?' * len(names))})",
+                (workspace, *names)).fetchall()
+        scenarios = {name: {'name': name, 'parameters': json.loads(parameters), 'allocation': json.loads(allocation)}
+                     for name, parameters, allocation in rows}
+        return [scenarios[name] for name in names if name in scenarios]
+
+    def delete(self, workspace, name):
+        """
+        Delete a scenario of the workspace, if it exists
+        """
+        with self.pool.connection() as conn, conn:
+            conn.execute("DELETE FROM scenarios WHERE workspace = ? AND name = ?", (workspace, name))
+
+
+
+def evaluate_scenarios(scenarios, allocation_index, fee_schedule=None):
+    """
+    Simulate scenarios side by side with one simulate_investment_batch call.
+
+    Returns the weighted annual return, the year-end portfolio values [scenario x year]
+    (NaN past a scenario's horizon), the future value and the monthly income of each.
+    Scenarios whose parameters have glide_path follow the allocations of their age
+    buckets (age and investor_profile), the others keep their own allocation.
+    With a fee_schedule, the values are net of the fees and taxes of each scenario's
+    allocation and status (scenarios saved without a status count as DEFAULT_STATUS).
+    """
+    columns = {name: np.array([scenario['parameters'][name] for scenario in scenarios], dtype=float)
+               for name in SCENARIO_PARAMETERS}
+    allocations = np.array([allocation_index.allocation_vector(scenario['allocation']) for scenario in scenarios])
+    weighted_annual_return = allocation_index.portfolio_returns(allocations)
+
+    years = columns['years'].astype(int)
+    annual_returns = None
+    glide = [i for i, scenario in enumerate(scenarios) if scenario['parameters'].get('glide_path')]
+    if glide:
+        # One row of returns per scenario: constant, or following the age buckets
+        annual_returns = np.repeat(weighted_annual_return[:, None], years.max(), axis=1)
+        annual_returns[glide] = allocation_index.glide_path_returns(
+            [scenarios[i]['parameters']['age'] for i in glide], [scenarios[i]['parameters']['investor_profile'] for i in glide], years.max())
+        within_horizon = np.arange(years.max()) < years[:, None]
+        weighted_annual_return = (annual_returns * within_horizon).sum(axis=1) / years
+
+    fees = None
+    if fee_schedule is not None:
+        fees = fee_schedule.portfolio_fees([scenario['parameters'].get('status', DEFAULT_STATUS) for scenario in scenarios], allocations)
+
+    _, initial_amount_array, invested_array, earnings_array, last_year_withdraw_amount = simulate_investment_batch(
+        years, columns['monthly_amount'], weighted_annual_return, columns['initial_amount'], columns['inflation_rate'],
+        columns['withdrawal_rate'], columns['years_until_withdrawal'], annual_returns, fees)
+    values = initial_amount_array + invested_array + earnings_array
+    return {
+        'weighted_annual_return': weighted_annual_return,
+        'values': values,
+        'future_value': values[np.arange(len(scenarios)), years - 1],
+        'monthly_income': last_year_withdraw_amount / 12,
+    }
+
+
+
+# Saved scenarios of the app; the database is only opened on first use
+scenario_store = ScenarioStore()
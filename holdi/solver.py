@@ -0,0 +1,119 @@
+"""
+Inverse problems and sweeps over the deterministic projection.
+
+Every solver evaluates all its targets with batch simulations, so a whole table of
+goals costs a handful of simulate_investment_batch calls.
+"""
+import numpy as np
+
+from holdi.engine import NO_FEES, future_value_batch, invested_basis, simulate_investment_batch
+
+
+# Parameters of the projection that can be swept
+SWEEP_PARAMETERS = ('monthly_amount', 'weighted_annual_return', 'years', 'initial_amount',
+                    'inflation_rate', 'withdrawal_rate', 'years_until_withdrawal')
+
+
+
+def solve_monthly_amount(target_value, years, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                         annual_returns=None, fees=None):
+    """
+    Monthly amount reaching target_value after `years`, for each target (vectorized).
+
+    The value before the tax at realization and the tax basis are affine in the monthly amount,
+    so two simulations give the exact answer. Returns 0 where the initial amount alone is enough,
+    NaN where no amount can reach the target. annual_returns optionally gives the return of every
+    year (a glide path), fees the fee rates of simulate_investment_batch.
+    """
+    *fees, exit_tax = NO_FEES if fees is None else fees
+    without_contribution = future_value_batch(years, 0, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                                              annual_returns, (*fees, 0.0))
+    per_unit = future_value_batch(years, 1, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                                  annual_returns, (*fees, 0.0)) - without_contribution
+    months = 12 * np.asarray(years)
+    basis_without_contribution = invested_basis(months, 0, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal)
+    basis_per_unit = invested_basis(months, 1, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal) - basis_without_contribution
+    # The net value is the smaller of the value and (1 - exit_tax) * value + exit_tax * basis
+    net_without_contribution = (1 - exit_tax) * without_contribution + exit_tax * basis_without_contribution
+    net_per_unit = (1 - exit_tax) * per_unit + exit_tax * basis_per_unit
+    target_value = np.asarray(target_value, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        monthly_amount = np.maximum((target_value - without_contribution) / per_unit, (target_value - net_without_contribution) / net_per_unit)
+    return np.where((per_unit > 0) & (net_per_unit > 0), np.maximum(monthly_amount, 0), np.nan)
+
+
+
+def solve_years(target_value, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal, max_years=50,
+                annual_returns=None, fees=None):
+    """
+    Smallest whole number of years reaching target_value, for each target (vectorized).
+
+    One batch simulation over max_years gives every horizon at once. Returns NaN where the
+    target is not reached within max_years. annual_returns, if given, must cover max_years.
+    """
+    target_value, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(value, dtype=float)) for value in (
+            target_value, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal)))
+    _, initial_amount_array, invested_array, earnings_array, _ = simulate_investment_batch(
+        max_years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+        annual_returns, fees)
+    reached = initial_amount_array + invested_array + earnings_array >= target_value[:, None]
+    return np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, np.nan)
+
+
+
+def solve_annual_return(target_value, years, monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                        low=-0.5, high=1.0, tolerance=1e-7, fees=None):
+    """
+    Weighted annual return (gross of fees) reaching target_value after `years`, for each target (vectorized).
+
+    The future value increases with the return, so all targets are bisected together,
+    one batch simulation per step. Returns NaN where the target is outside [low, high].
+    """
+    target_value, years, monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(value, dtype=float)) for value in (
+            target_value, years, monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal)))
+
+    def future_value(weighted_annual_return):
+        return future_value_batch(years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                                  fees=fees)
+
+    low = np.full(target_value.shape, low)
+    high = np.full(target_value.shape, high)
+    feasible = (future_value(low) <= target_value) & (future_value(high) >= target_value)
+    for _ in range(int(np.ceil(np.log2((high[0] - low[0]) / tolerance))) if target_value.size else 0):
+        middle = (low + high) / 2
+        below = future_value(middle) < target_value
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+    return np.where(feasible, (low + high) / 2, np.nan)
+
+
+
+def sweep_range(parameter, base_value, points):
+    """
+    Default values swept for a parameter around its current value
+    """
+    if parameter == 'weighted_annual_return':
+        return np.linspace(0, max(0.2, 2 * base_value), points)
+    if parameter in ('years', 'years_until_withdrawal'):
+        return np.unique(np.linspace(3 if parameter == 'years' else 0, 50, points).round())
+    if parameter in ('inflation_rate', 'withdrawal_rate'):
+        return np.linspace(0, max(10, 2 * base_value), points)
+    return np.linspace(0, max(1000, 2 * base_value), points)
+
+
+
+def sweep_future_value(base, axes):
+    """
+    Future value over the Cartesian grid of axes ({parameter: values}), the other
+    parameters (and optionally the fees) being taken from base. The whole grid is one
+    batch simulation; the result has one dimension per axis, in order.
+    """
+    unknown = set(axes) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Cannot sweep {', '.join(sorted(unknown))}")
+    grids = np.meshgrid(*(np.asarray(values, dtype=float) for values in axes.values()), indexing='ij')
+    inputs = dict(base)
+    inputs.update({parameter: grid.ravel() for parameter, grid in zip(axes, grids)})
+    return future_value_batch(**inputs).reshape(grids[0].shape)
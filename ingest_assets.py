@@ -0,0 +1,382 @@
+"""
+Load the asset table from the Excel workbook into the database and its binary snapshot.
+
+    python ingest_assets.py [data/calculateur_holdi.xlsx] [--db data/investment_data.db] [--force]
+
+The `Custom` sheet is validated (columns, numeric values, risk ratings, allocations
+summing to 100% for every age bucket and profile) before anything is written. Each
+ingest appends a new version of the rows to the `asset_rows` table, and the
+`assets_return_allocation` view read by the app always shows the latest one. Nothing
+is parsed when the workbook checksum equals the one of the latest version, except to
+fill the tables of the latest version that its database did not have yet.
+
+An optional `Covariance` sheet gives the annual covariance matrix of the fund log
+returns (fund names in the first column and in the header row). It must be symmetric,
+positive semi-definite and cover the funds of the `Custom` sheet; without it, the matrix
+is derived from the risk ratings. Each version stores its matrix in `asset_covariance`.
+
+An optional `Frais` sheet gives the fee schedule, one row per status and fund: `Statut`,
+the fund column, then the entry fee, annual management fee and tax on gains as decimals.
+The statuses and funds without a row keep the default rates of holdi.fees. Each version
+stores the complete schedule in `asset_fees`.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from holdi.allocation import AGE_COLUMNS, PROFILE_OFFSET_COLUMNS, PROFILES
+from holdi.assets import ASSET_DTYPE, DB_PATH, FUND_COLUMN, get_asset_version, query_asset_records, snapshot_path, write_snapshot
+from holdi.fees import FEE_RATES, STATUSES, FeeSchedule
+from holdi.montecarlo import RISK_VOLATILITY, covariance_from_ratings
+
+
+WORKBOOK_PATH = os.path.join(os.path.dirname(DB_PATH), 'calculateur_holdi.xlsx')
+SHEET_NAME = 'Custom'
+COVARIANCE_SHEET_NAME = 'Covariance'
+FEES_SHEET_NAME = 'Frais'
+# Columns of the Frais sheet holding each rate of FEE_RATES
+FEE_COLUMNS = dict(zip(FEE_RATES, ("Frais d'entrée", 'Frais de gestion', 'Fiscalité des plus-values')))
+# Largest gap allowed between the sum of an allocation and 100%
+ALLOCATION_TOLERANCE = 0.005
+
+QUOTED_COLUMNS = ', '.join(f'"{name}"' for name in ASSET_DTYPE.names)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS asset_versions (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    checksum TEXT NOT NULL,
+    source TEXT NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS asset_rows (
+    version INTEGER NOT NULL REFERENCES asset_versions (version),
+    "FONDS PROPOSÉS A TERME" TEXT NOT NULL,
+    "Taux" REAL NOT NULL,
+    "Notation du risque" INTEGER NOT NULL,
+    "Profil Prudent" REAL NOT NULL,
+    "Profil Dynamique" REAL NOT NULL,
+    {age_columns},
+    PRIMARY KEY (version, "FONDS PROPOSÉS A TERME")
+);
+CREATE TABLE IF NOT EXISTS asset_covariance (
+    version INTEGER NOT NULL REFERENCES asset_versions (version),
+    fund_a TEXT NOT NULL,
+    fund_b TEXT NOT NULL,
+    covariance REAL NOT NULL,
+    PRIMARY KEY (version, fund_a, fund_b)
+);
+CREATE TABLE IF NOT EXISTS asset_fees (
+    version INTEGER NOT NULL REFERENCES asset_versions (version),
+    status TEXT NOT NULL,
+    fund TEXT NOT NULL,
+    entry_fee REAL NOT NULL,
+    management_fee REAL NOT NULL,
+    gains_tax REAL NOT NULL,
+    PRIMARY KEY (version, status, fund)
+);
+CREATE VIEW IF NOT EXISTS assets_return_allocation AS
+    SELECT {columns} FROM asset_rows
+    WHERE version = (SELECT MAX(version) FROM asset_versions)
+    ORDER BY rowid;
+'''.format(age_columns=',\n    '.join(f'"{column}" REAL NOT NULL' for column in AGE_COLUMNS),
+           columns=QUOTED_COLUMNS)
+
+
+
+class IngestError(Exception):
+    """
+    The workbook does not hold a valid asset table
+    """
+
+
+
+def file_checksum(path):
+    """
+    SHA-256 of a file, read in blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+
+def validate_assets(df):
+    """
+    Checked copy of the Custom sheet, restricted to the asset table columns;
+    raises IngestError listing every problem found
+    """
+    missing = [name for name in ASSET_DTYPE.names if name not in df.columns]
+    if missing:
+        raise IngestError(f"Missing columns in the {SHEET_NAME} sheet: {', '.join(missing)}")
+    df = df[list(ASSET_DTYPE.names)].dropna(how='all').reset_index(drop=True)
+
+    problems = []
+    funds = df[FUND_COLUMN].astype(str).str.strip()
+    if (df[FUND_COLUMN].isna() | (funds == '')).any():
+        problems.append("Every row needs a fund name")
+    duplicated = sorted(set(funds[funds.duplicated()]))
+    if duplicated:
+        problems.append(f"Duplicated funds: {', '.join(duplicated)}")
+    df[FUND_COLUMN] = funds
+
+    for name in ASSET_DTYPE.names[1:]:
+        values = pd.to_numeric(df[name], errors='coerce')
+        not_numeric = values.isna() & df[name].notna()
+        if not_numeric.any():
+            problems.append(f"Non-numeric values in '{name}' for {', '.join(funds[not_numeric])}")
+        # An empty profile offset means no change to the balanced allocation
+        df[name] = values.fillna(0) if name in PROFILE_OFFSET_COLUMNS else values
+        if df[name].isna().any() and not not_numeric.any():
+            problems.append(f"Missing values in '{name}' for {', '.join(funds[df[name].isna()])}")
+
+    ratings = df['Notation du risque']
+    if not ratings.dropna().isin(list(RISK_VOLATILITY)).all():
+        problems.append(f"'Notation du risque' must be one of {sorted(RISK_VOLATILITY)}")
+
+    if not problems:
+        for p, offset_column in enumerate(PROFILE_OFFSET_COLUMNS):
+            offset = 0 if offset_column is None else df[offset_column]
+            for column in AGE_COLUMNS:
+                total = (df[column] + offset).sum()
+                if abs(total - 1) > ALLOCATION_TOLERANCE:
+                    problems.append(f"Allocation '{column}' ({PROFILES[p]}) sums to {total:.1%}, not 100%")
+
+    if problems:
+        raise IngestError('\n'.join(problems))
+    df['Notation du risque'] = df['Notation du risque'].astype(int)
+    return df
+
+
+
+def validate_covariance(df, funds):
+    """
+    Covariance sheet as a matrix [fund x fund] in the order of funds;
+    raises IngestError listing every problem found
+    """
+    df = df.set_index(df.columns[0])
+    df.index = df.index.astype(str).str.strip()
+    df.columns = df.columns.astype(str).str.strip()
+    problems = []
+    for where, names in (('rows', set(df.index)), ('columns', set(df.columns))):
+        missing = [fund for fund in funds if fund not in names]
+        if missing:
+            problems.append(f"Missing {where} in the {COVARIANCE_SHEET_NAME} sheet: {', '.join(missing)}")
+    if problems:
+        raise IngestError('\n'.join(problems))
+
+    matrix = df.loc[funds, funds].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    if np.isnan(matrix).any():
+        raise IngestError(f"The {COVARIANCE_SHEET_NAME} sheet has missing or non-numeric values")
+    if not np.allclose(matrix, matrix.T, rtol=1e-6, atol=1e-10):
+        problems.append("The covariance matrix is not symmetric")
+    elif np.linalg.eigvalsh(matrix).min() < -1e-10 * max(np.abs(matrix).max(), 1e-300):
+        problems.append("The covariance matrix is not positive semi-definite")
+    if problems:
+        raise IngestError('\n'.join(problems))
+    return matrix
+
+
+
+def read_covariance_and_fees(workbook_path, assets):
+    """
+    Covariance matrix and FeeSchedule of the workbook; without their sheet, the covariance
+    implied by the risk ratings and the default rates
+    """
+    funds = assets[FUND_COLUMN].tolist()
+    with pd.ExcelFile(workbook_path) as workbook:
+        if COVARIANCE_SHEET_NAME in workbook.sheet_names:
+            covariance = validate_covariance(workbook.parse(COVARIANCE_SHEET_NAME), funds)
+        else:
+            covariance = covariance_from_ratings(assets['Notation du risque'])
+        if FEES_SHEET_NAME in workbook.sheet_names:
+            fees = validate_fees(workbook.parse(FEES_SHEET_NAME), funds)
+        else:
+            fees = FeeSchedule.default(funds)
+    return covariance, fees
+
+
+
+def validate_fees(df, funds):
+    """
+    FeeSchedule of the Frais sheet for funds; raises IngestError listing every problem found
+    """
+    missing = [name for name in ('Statut', FUND_COLUMN, *FEE_COLUMNS.values()) if name not in df.columns]
+    if missing:
+        raise IngestError(f"Missing columns in the {FEES_SHEET_NAME} sheet: {', '.join(missing)}")
+    df = df.dropna(how='all').reset_index(drop=True)
+
+    problems = []
+    statuses = df['Statut'].astype(str).str.strip()
+    unknown = sorted(set(statuses[~statuses.isin(STATUSES)]))
+    if unknown:
+        problems.append(f"Unknown statuses: {', '.join(unknown)} (expected {', '.join(STATUSES)})")
+    df_funds = df[FUND_COLUMN].astype(str).str.strip()
+    unknown = sorted(set(df_funds[~df_funds.isin(funds)]))
+    if unknown:
+        problems.append(f"Funds missing from the {SHEET_NAME} sheet: {', '.join(unknown)}")
+    duplicated = sorted(set(statuses[(statuses + '|' + df_funds).duplicated()]))
+    if duplicated:
+        problems.append(f"Funds listed twice for: {', '.join(duplicated)}")
+
+    rates = {}
+    for rate, column in FEE_COLUMNS.items():
+        values = pd.to_numeric(df[column], errors='coerce')
+        if values.isna().any():
+            problems.append(f"Missing or non-numeric values in '{column}'")
+        elif not values.between(0, 1, inclusive='left').all():
+            problems.append(f"'{column}' must be a decimal between 0 and 1 (0.01 = 1%)")
+        rates[rate] = values
+    if problems:
+        raise IngestError('\n'.join(problems))
+    return FeeSchedule.from_rows(funds, zip(statuses, df_funds, *(rates[rate] for rate in FEE_RATES)))
+
+
+
+def to_records(df):
+    """
+    Validated asset table as an array of ASSET_DTYPE records
+    """
+    return np.array(list(df[list(ASSET_DTYPE.names)].itertuples(index=False, name=None)), dtype=ASSET_DTYPE)
+
+
+
+def ensure_schema(conn):
+    """
+    Create the versioned tables, replacing the table written by the former notebook by the view
+    """
+    legacy = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'assets_return_allocation'").fetchone()
+    if legacy == ('table',):
+        conn.execute("DROP TABLE assets_return_allocation")
+    # One statement at a time: executescript would commit the caller's transaction
+    for statement in SCHEMA.split(';'):
+        if statement.strip():
+            conn.execute(statement)
+
+
+
+def insert_covariance(conn, version, funds, covariance):
+    """
+    Store the covariance matrix [fund x fund] of a version
+    """
+    conn.executemany(
+        "INSERT INTO asset_covariance (version, fund_a, fund_b, covariance) VALUES (?, ?, ?, ?)",
+        [(version, fund_a, fund_b, float(covariance[a, b]))
+         for a, fund_a in enumerate(funds) for b, fund_b in enumerate(funds)])
+
+
+
+def insert_fees(conn, version, funds, fees):
+    """
+    Store the complete FeeSchedule of a version
+    """
+    conn.executemany(
+        "INSERT INTO asset_fees (version, status, fund, entry_fee, management_fee, gains_tax) VALUES (?, ?, ?, ?, ?, ?)",
+        [(version, status, fund, *fees.rates[s, f].tolist())
+         for s, status in enumerate(STATUSES) for f, fund in enumerate(funds)])
+
+
+
+def complete_version(conn, version, workbook_path):
+    """
+    Create the tables missing from a database written by an older ingest, and fill the
+    covariance and fees of the version from its (unchanged) workbook if they are missing;
+    returns whether anything was written
+    """
+    missing = [table for table in ('asset_covariance', 'asset_fees') if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone() is None or conn.execute(
+        f"SELECT 1 FROM {table} WHERE version = ? LIMIT 1", (version,)).fetchone() is None]
+    if not missing:
+        return False
+    assets = validate_assets(pd.read_excel(workbook_path, sheet_name=SHEET_NAME))
+    covariance, fees = read_covariance_and_fees(workbook_path, assets)
+    funds = assets[FUND_COLUMN].tolist()
+    with conn:
+        conn.execute("BEGIN")
+        ensure_schema(conn)
+        if 'asset_covariance' in missing:
+            insert_covariance(conn, version, funds, covariance)
+        if 'asset_fees' in missing:
+            insert_fees(conn, version, funds, fees)
+    return True
+
+
+
+def latest_version(conn):
+    """
+    (version, checksum) of the latest ingest, None before the first one
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'asset_versions'").fetchone() is None:
+        return None
+    return conn.execute("SELECT version, checksum FROM asset_versions ORDER BY version DESC LIMIT 1").fetchone()
+
+
+
+def ingest(workbook_path=WORKBOOK_PATH, db_path=DB_PATH, force=False):
+    """
+    Ingest the workbook unless its checksum is the one of the latest version; returns
+    the version now served and whether a new one was written
+    """
+    checksum = file_checksum(workbook_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        latest = latest_version(conn)
+        if latest is not None and latest[1] == checksum and not force:
+            complete_version(conn, latest[0], workbook_path)
+            db_mtime, _, snapshot_mtime = get_asset_version(db_path)
+            if snapshot_mtime is None or snapshot_mtime < db_mtime:
+                write_snapshot(query_asset_records(db_path), db_path)
+            return latest[0], False
+
+        assets = validate_assets(pd.read_excel(workbook_path, sheet_name=SHEET_NAME))
+        records = to_records(assets)
+        covariance, fees = read_covariance_and_fees(workbook_path, assets)
+        with conn:
+            # Schema changes and rows are committed together, or not at all
+            conn.execute("BEGIN")
+            ensure_schema(conn)
+            version = conn.execute(
+                "INSERT INTO asset_versions (checksum, source, ingested_at) VALUES (?, ?, ?)",
+                (checksum, os.path.basename(workbook_path), datetime.now(timezone.utc).isoformat(timespec='seconds'))).lastrowid
+            placeholders = ', '.join('?' * (len(ASSET_DTYPE.names) + 1))
+            conn.executemany(
+                f"INSERT INTO asset_rows (version, {QUOTED_COLUMNS}) VALUES ({placeholders})",
+                [(version, *record) for record in records.tolist()])
+            funds = assets[FUND_COLUMN].tolist()
+            insert_covariance(conn, version, funds, covariance)
+            insert_fees(conn, version, funds, fees)
+    finally:
+        conn.close()
+
+    # Written after the database so that its modification time marks it as up to date
+    write_snapshot(records, db_path)
+    return version, True
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the asset table from the Excel workbook.")
+    parser.add_argument('workbook', nargs='?', default=WORKBOOK_PATH, help="Excel workbook with a Custom sheet (default: data/calculateur_holdi.xlsx)")
+    parser.add_argument('--db', default=DB_PATH, help="SQLite database (default: data/investment_data.db)")
+    parser.add_argument('--force', action='store_true', help="Ingest even if the workbook is unchanged")
+    args = parser.parse_args(argv)
+    try:
+        version, written = ingest(args.workbook, args.db, args.force)
+    except IngestError as error:
+        print(f"{args.workbook} was not ingested:\n{error}", file=sys.stderr)
+        return 1
+    print(f"Asset table version {version} {'written' if written else 'unchanged'} in {args.db} and {snapshot_path(args.db)}")
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Headless bulk simulation of client profiles.
+
+Streams profiles from a CSV or Parquet file, runs the simulator chain (allocation,
+weighted return, simulate_investment_batch) chunk by chunk across a process pool, and writes one result file per chunk into the
+output directory. Chunks already written are skipped, so an interrupted run resumes
+where it stopped when launched again with the same arguments.
+
+Usage (from the project directory, like `streamlit run app.py`):
+
+    python simulate_batch.py profiles.csv results/ --chunk-size 5000 --workers 4
+
+Input columns: salary, age, investment_perc and optionally id, investor_profile, status
+and overrides for initial_amount, monthly_amount, withdrawal_rate, inflation_rate,
+years_until_withdrawal and years. Missing values take the simulator page defaults.
+Results are net of the fees and taxes of each client's allocation and status.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+from holdi.assets import get_allocation_index, get_fee_schedule
+from holdi.engine import simulate_investment_batch
+from holdi.fees import DEFAULT_STATUS
+
+
+# Same bounds as the "Nombre d'années de placement" slider
+MIN_YEARS = 3
+MAX_YEARS = 50
+
+RESULT_COLUMNS = ['id', 'investor_profile', 'status', 'weighted_annual_return', 'future_value',
+                  'capital_gain', 'invested_and_initial_value', 'monthly_income']
+
+
+
+def read_profiles(path, chunk_size):
+    """
+    Yield DataFrames of at most chunk_size profiles, without loading the whole file
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+
+def apply_profile_defaults(profiles):
+    """
+    Fill the simulation parameters the same way the profile form of the simulator page does
+    """
+    profiles = profiles.copy()
+    savings = (profiles['salary'] * (profiles['investment_perc'] / 100)).astype(int)
+    defaults = {
+        'investor_profile': 'Profil Équilibré',
+        'status': DEFAULT_STATUS,
+        'initial_amount': savings,
+        'withdrawal_rate': 0,
+        'inflation_rate': 2,
+        'monthly_amount': savings,
+        'years_until_withdrawal': 5,
+        'years': 60 - profiles['age'],
+    }
+    for column, default in defaults.items():
+        if column in profiles:
+            profiles[column] = profiles[column].fillna(default)
+        else:
+            profiles[column] = default
+    profiles['years'] = profiles['years'].clip(MIN_YEARS, MAX_YEARS).astype(int)
+    return profiles
+
+
+
+def simulate_chunk(profiles):
+    """
+    Run the simulator chain for one chunk of profiles and return one result row per profile
+    """
+    profiles = apply_profile_defaults(profiles)
+    # One gather in the precomputed (age bucket, profile) weighted return table for the whole chunk
+    allocation_index = get_allocation_index()
+    ages, investor_profiles = profiles['age'].to_numpy(), profiles['investor_profile'].to_numpy()
+    weighted_annual_return = allocation_index.weighted_returns(ages, investor_profiles)
+    fees = get_fee_schedule().portfolio_fees(profiles['status'].to_numpy(), allocation_index.client_allocations(ages, investor_profiles))
+
+    _, initial_amount_array, invested_array, earnings_array, last_year_withdraw_amount = simulate_investment_batch(
+        profiles['years'].to_numpy(), profiles['monthly_amount'].to_numpy(), weighted_annual_return,
+        profiles['initial_amount'].to_numpy(), profiles['inflation_rate'].to_numpy(),
+        profiles['withdrawal_rate'].to_numpy(), profiles['years_until_withdrawal'].to_numpy(), fees=fees)
+
+    last_year = profiles['years'].to_numpy()[:, None] - 1
+    invested = np.take_along_axis(invested_array, last_year, axis=1)[:, 0]
+    earnings = np.take_along_axis(earnings_array, last_year, axis=1)[:, 0]
+    initial_amount = profiles['initial_amount'].to_numpy()
+
+    return pd.DataFrame({
+        'id': profiles['id'].to_numpy() if 'id' in profiles else profiles.index.to_numpy(),
+        'investor_profile': profiles['investor_profile'].to_numpy(),
+        'status': profiles['status'].to_numpy(),
+        'weighted_annual_return': weighted_annual_return,
+        'future_value': initial_amount + invested + earnings,
+        'capital_gain': earnings,
+        'invested_and_initial_value': initial_amount + invested,
+        'monthly_income': last_year_withdraw_amount / 12,
+    }, columns=RESULT_COLUMNS)
+
+
+
+def write_part(results, path):
+    """
+    Write a result chunk atomically, so a crash never leaves a partial file behind
+    """
+    tmp_path = path + '.tmp'
+    if path.endswith('.parquet'):
+        results.to_parquet(tmp_path, index=False)
+    else:
+        results.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+
+def check_manifest(output_dir, input_path, chunk_size):
+    """
+    Refuse to resume into an output directory written with different chunking
+    """
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    manifest = {'input': os.path.abspath(input_path), 'chunk_size': chunk_size}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise SystemExit(f"{output_dir} was written with {previous}, not {manifest}; use another output directory")
+    else:
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+
+
+def run(input_path, output_dir, chunk_size=5000, workers=None, output_format='csv'):
+    """
+    Simulate every profile of input_path into output_dir, skipping chunks already written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    check_manifest(output_dir, input_path, chunk_size)
+    workers = workers or os.cpu_count()
+
+    start = time.perf_counter()
+    done_rows = 0
+    skipped_chunks = 0
+    pending = {}
+
+    def collect(futures):
+        nonlocal done_rows
+        for future in futures:
+            part_path = pending.pop(future)
+            results = future.result()
+            write_part(results, part_path)
+            done_rows += len(results)
+        elapsed = time.perf_counter() - start
+        print(f"{done_rows} profiles in {elapsed:.1f} s ({done_rows / elapsed:,.0f} rows/s)", file=sys.stderr)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        offset = 0
+        for i, profiles in enumerate(read_profiles(input_path, chunk_size)):
+            # Row numbers identify profiles when the input has no id column
+            profiles.index = pd.RangeIndex(offset, offset + len(profiles))
+            offset += len(profiles)
+            part_path = os.path.join(output_dir, f'part-{i:05d}.{output_format}')
+            if os.path.exists(part_path):
+                skipped_chunks += 1
+                continue
+            # Bound the chunks in flight so memory stays flat whatever the input size
+            if len(pending) >= 2 * workers:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending[executor.submit(simulate_chunk, profiles)] = part_path
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    elapsed = time.perf_counter() - start
+    print(f"Done: {done_rows} profiles simulated, {skipped_chunks} chunks already present, "
+          f"{elapsed:.1f} s ({done_rows / max(elapsed, 1e-9):,.0f} rows/s)", file=sys.stderr)
+    return done_rows
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a whole book of client profiles.")
+    parser.add_argument('input', help="CSV or .parquet file of client profiles")
+    parser.add_argument('output_dir', help="Directory receiving one result file per chunk")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Profiles per chunk (default: 5000)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="Result file format (default: csv)")
+    args = parser.parse_args(argv)
+    run(args.input, args.output_dir, args.chunk_size, args.workers, args.format)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+The tests import the project modules from the project directory, like `streamlit run app.py`.
+"""
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,56 @@
+"""
+Precomputed allocation index against the per-client lookups it replaces.
+"""
+import numpy as np
+import pytest
+
+from holdi.allocation import (AGE_BUCKET_STARTS, AGE_COLUMNS, PROFILES, calculate_weighted_annual_return, generate_asset_allocation,
+                              generate_asset_return)
+from holdi.assets import get_allocation_index, get_asset_data
+
+
+# First and last age of every bucket, and ages outside the table
+AGES = sorted({age for start in AGE_BUCKET_STARTS for age in (start, start + 4)} | {18, 90})
+
+
+
+def age_column(age):
+    """
+    Bucket of an age as chosen by the original if/elif chain of the page
+    """
+    for start, column in zip(AGE_BUCKET_STARTS[:-1], AGE_COLUMNS):
+        if start <= age <= start + 4:
+            return column
+    return AGE_COLUMNS[-1]
+
+
+
+@pytest.mark.parametrize('investor_profile', PROFILES)
+@pytest.mark.parametrize('age', AGES)
+def test_index_matches_the_allocation_of_the_asset_table(age, investor_profile):
+    df = get_asset_data()
+    index = get_allocation_index()
+    allocation = generate_asset_allocation(df, age, investor_profile)
+    assert list(allocation) == list(index.funds)
+    np.testing.assert_array_equal(index.allocation(age, investor_profile), list(allocation.values()))
+
+    # The bucket and offsets read straight from the table, as the page did before the index
+    offset = 0 if investor_profile == 'Profil Équilibré' else df[investor_profile]
+    np.testing.assert_array_equal(index.allocation(age, investor_profile), (df[age_column(age)] + offset).round(2))
+
+    expected = calculate_weighted_annual_return(generate_asset_return(df), allocation)
+    assert index.weighted_return(age, investor_profile) == pytest.approx(expected, rel=1e-12)
+    assert index.weighted_returns([age], [investor_profile])[0] == pytest.approx(expected, rel=1e-12)
+    np.testing.assert_array_equal(index.client_allocations([age], [investor_profile])[0], index.allocation(age, investor_profile))
+
+
+
+def test_glide_path_returns_follow_the_age_reached_every_year():
+    index = get_allocation_index()
+    ages, profiles, years = np.array([25, 44, 60]), ['Profil Prudent', 'Profil Équilibré', 'Profil Dynamique'], 40
+    annual_returns = index.glide_path_returns(ages, profiles, years)
+    assert annual_returns.shape == (3, years)
+    for client, (age, profile) in enumerate(zip(ages, profiles)):
+        expected = [index.weighted_return(age + year, profile) for year in range(years)]
+        np.testing.assert_array_equal(annual_returns[client], expected)
+        np.testing.assert_allclose(annual_returns[client], index.portfolio_returns(index.glide_path_allocations(age, profile, years)), rtol=1e-12)
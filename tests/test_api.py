@@ -0,0 +1,126 @@
+"""
+Answers of the HTTP API to valid and malformed requests, through a real connection.
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import api
+
+
+MALFORMED = [
+    ('/allocation', b'{"age": "abc"}'),
+    ('/allocation', b'{"age": null}'),
+    ('/allocation', b'{}'),
+    ('/allocation', b'{"age": 30, "investor_profile": ["Profil Prudent"]}'),
+    ('/allocation', b'{"age": NaN}'),
+    ('/weighted-return', b'{"allocation": {"ETF": "x"}}'),
+    ('/weighted-return', b'{"allocation": {"Unknown fund": 1}}'),
+    ('/weighted-return', b'{"allocation": [1, 2]}'),
+    ('/weighted-return', b'{"age": {"value": 30}}'),
+    ('/weighted-return', b'{}'),
+    ('/simulate', b'{"age": "abc"}'),
+    ('/simulate', b'{"age": 30, "years": "ten"}'),
+    ('/simulate', b'{"age": 30, "years": Infinity}'),
+    ('/simulate', b'{"age": 30, "status": "Association"}'),
+    ('/simulate', b'{"age": 30, "monthly_amount": true}'),
+    ('/simulate', b'{"years": 10}'),
+    ('/simulate', b'{"profiles": [1, 2]}'),
+    ('/simulate', b'{"profiles": {"age": 30}}'),
+    ('/simulate', b'{"profiles": []}'),
+]
+NOT_OBJECTS = [b'[{"age": 30}]', b'"age"', b'30', b'null']
+
+
+
+async def request(port, method, path, body=b'', headers=''):
+    """
+    (status, payload) of one request on a new connection
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n{headers}Connection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    status = int(head.split()[1]) if head else 0
+    return status, json.loads(content) if content.startswith((b'{', b'[')) else content.decode()
+
+
+
+def exchange(*requests, simulate_profiles=api.simulate_profiles):
+    """
+    Answers to requests ((method, path, body) tuples) of a server started for the test
+    """
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            server_api = api.SimulationAPI(executor)
+            server_api.batcher.function = simulate_profiles
+            server_api.batcher.start()
+            server = await asyncio.start_server(lambda reader, writer: api.handle_connection(server_api, reader, writer), '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return [await request(port, *request_args) for request_args in requests]
+            finally:
+                server.close()
+                await server_api.batcher.stop()
+
+    return asyncio.run(run())
+
+
+
+def test_valid_requests():
+    (status, allocation), (_, weighted_return), (_, simulation), (_, batch) = exchange(
+        ('POST', '/allocation', b'{"age": 30}'),
+        ('POST', '/weighted-return', b'{"age": 30}'),
+        ('POST', '/simulate', b'{"salary": 2500, "investment_perc": 17, "age": 30}'),
+        ('POST', '/simulate', b'{"profiles": [{"age": 30}, {"weighted_annual_return": 0.05, "years": 10}]}'))
+    assert status == 200 and sum(allocation.values()) == pytest.approx(1)
+    assert weighted_return['weighted_annual_return'] > 0
+    assert simulation['future_value'] > simulation['invested_and_initial_value']
+    assert len(batch['results']) == 2
+
+
+
+@pytest.mark.parametrize('path, body', MALFORMED)
+def test_malformed_fields_are_bad_requests(path, body):
+    [(status, payload)] = exchange(('POST', path, body))
+    assert status == 400
+    assert payload['error']
+
+
+
+@pytest.mark.parametrize('path', ['/allocation', '/weighted-return', '/simulate'])
+@pytest.mark.parametrize('body', NOT_OBJECTS + [b'{"age": 30'])
+def test_bodies_that_are_not_objects_are_bad_requests(path, body):
+    [(status, payload)] = exchange(('POST', path, body))
+    assert status == 400
+    assert payload['error']
+
+
+
+def test_invalid_content_length_is_a_bad_request():
+    async def run():
+        server = await asyncio.start_server(lambda reader, writer: api.handle_connection(api.SimulationAPI(None), reader, writer), '127.0.0.1', 0)
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+        writer.write(b"POST /simulate HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+        response = await reader.read()
+        server.close()
+        return response
+
+    assert asyncio.run(run()).startswith(b'HTTP/1.1 400')
+
+
+
+def test_worker_failures_are_internal_errors():
+    def failing(profiles):
+        raise MemoryError("worker failed")
+
+    (status, payload), (health_status, _) = exchange(
+        ('POST', '/simulate', b'{"age": 30}'), ('GET', '/health'), simulate_profiles=failing)
+    assert status == 500
+    assert payload == {'error': 'Internal server error'}
+    # The server keeps answering
+    assert health_status == 200
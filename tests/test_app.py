@@ -0,0 +1,34 @@
+"""
+Decimation of the long series sent to the charts of the simulator page.
+"""
+import numpy as np
+import pytest
+
+from app import lttb_indices
+
+
+
+@pytest.mark.parametrize('n, max_points', [(600, 3), (600, 100), (601, 600), (1000, 250)])
+def test_lttb_keeps_the_ends_and_the_requested_count(n, max_points):
+    x = np.arange(n) / 12
+    y = np.cumsum(np.random.default_rng(n).normal(0, 1, n))
+    indices = lttb_indices(x, y, max_points)
+    assert len(indices) == max_points
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert (np.diff(indices) > 0).all()
+
+
+
+def test_lttb_keeps_the_peaks():
+    x = np.arange(600, dtype=float)
+    y = np.zeros(600)
+    y[[150, 420]] = [10.0, -10.0]
+    indices = lttb_indices(x, y, 20)
+    assert {150, 420} <= set(indices.tolist())
+
+
+
+@pytest.mark.parametrize('n, max_points', [(10, 10), (10, 50), (600, 2), (0, 100)])
+def test_lttb_is_the_identity_for_short_series(n, max_points):
+    x = np.arange(n, dtype=float)
+    np.testing.assert_array_equal(lttb_indices(x, x ** 2, max_points), np.arange(n))
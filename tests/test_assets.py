@@ -0,0 +1,26 @@
+"""
+Asset DataFrame shared by every session of the process.
+"""
+import pytest
+
+from holdi.assets import get_asset_data
+
+
+
+def test_callers_cannot_change_the_shared_data():
+    data = get_asset_data()
+    reference = get_asset_data().copy()
+
+    # Columns added or replaced stay in the caller's frame
+    data['x'] = 1.0
+    data['Taux'] = 0.0
+    data.sort_values('FONDS PROPOSÉS A TERME', inplace=True)
+    assert get_asset_data().equals(reference)
+
+    # Values written in place are refused instead of leaking to the other sessions
+    data = get_asset_data()
+    with pytest.raises(ValueError):
+        data.loc[0, 'Taux'] = 1.0
+    with pytest.raises(ValueError):
+        data.iloc[0, 0] = 'Autre fonds'
+    assert get_asset_data().equals(reference)
@@ -0,0 +1,47 @@
+"""
+Vectorized rolling-start backtest against a loop over start months.
+"""
+import numpy as np
+import pytest
+
+from holdi.backtest import backtest_year_end_values
+
+
+
+def naive_backtest(monthly_returns, years, monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal):
+    """
+    Year-end values of every start month [window x year], one window and one month at a time
+    """
+    horizon = 12 * years
+    contribution = monthly_amount * (1 + inflation_rate / 100)
+    keep = 1 - withdrawal_rate / 1200
+    values = []
+    for start in range(len(monthly_returns) - horizon + 1):
+        value, year_ends = float(initial_amount), []
+        for month in range(horizon):
+            value = value * (1 + monthly_returns[start + month]) + contribution
+            if month >= 12 * np.ceil(years_until_withdrawal):
+                value *= keep
+            if month % 12 == 11:
+                year_ends.append(value)
+        values.append(year_ends)
+    return np.array(values)
+
+
+
+@pytest.mark.parametrize('withdrawal_rate, years_until_withdrawal', [(0, 5), (4, 3), (6, 2.5), (4, 0)])
+def test_every_start_month_matches_the_loop(withdrawal_rate, years_until_withdrawal):
+    # Ten years of returns with crashes, for plans of six years
+    rng = np.random.default_rng(0)
+    monthly_returns = rng.normal(0.006, 0.04, 120)
+    monthly_returns[[17, 64]] = -0.35
+    plan = (6, 425, 1000, 2, withdrawal_rate, years_until_withdrawal)
+    values = backtest_year_end_values(monthly_returns, *plan)
+    assert values.shape == (120 - 72 + 1, 6)
+    np.testing.assert_allclose(values, naive_backtest(monthly_returns, *plan), rtol=1e-10)
+
+
+
+def test_history_shorter_than_the_plan_is_refused():
+    with pytest.raises(ValueError):
+        backtest_year_end_values(np.zeros(59), 5, 425, 1000, 2, 0, 5)
@@ -0,0 +1,87 @@
+"""
+LRU eviction, expiry and counters of the shared result cache.
+"""
+import numpy as np
+import pytest
+
+from holdi.cache import ResultCache, canonical_key
+
+
+
+class Clock:
+    """
+    Clock advanced by hand
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+
+def cached(cache, key):
+    """
+    Value of key, and whether it was computed by this call
+    """
+    computed = []
+    value = cache.get_or_compute(key, lambda: computed.append(key) or f'value of {key}')
+    assert value == f'value of {key}'
+    return bool(computed)
+
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = ResultCache(maxsize=3, ttl=60, clock=Clock())
+    for key in 'abc':
+        assert cached(cache, key)
+    # Reading a refreshes it, so b is now the least recently used
+    assert not cached(cache, 'a')
+    assert cached(cache, 'd')
+    assert not cached(cache, 'a') and not cached(cache, 'c') and not cached(cache, 'd')
+    assert cached(cache, 'b')
+    # b pushed out a, the least recently used after the reads above
+    assert cached(cache, 'a')
+    assert cache.stats()['evictions'] == 3
+    assert cache.stats()['size'] == 3
+
+
+
+def test_entries_expire_ttl_seconds_after_being_computed():
+    clock = Clock()
+    cache = ResultCache(maxsize=10, ttl=60, clock=clock)
+    assert cached(cache, 'a')
+    clock.now = 30
+    assert cached(cache, 'b')
+    # Hits do not extend the lifetime of an entry
+    clock.now = 59.9
+    assert not cached(cache, 'a')
+    clock.now = 60
+    assert cached(cache, 'a')
+    assert not cached(cache, 'b')
+    clock.now = 90
+    assert cached(cache, 'b')
+    assert cache.stats()['expirations'] == 2
+
+
+
+def test_hit_and_miss_counts():
+    cache = ResultCache(maxsize=2, ttl=60, clock=Clock())
+    for key in 'aabab':
+        cached(cache, key)
+    cached(cache, 'c')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (3, 3, 1)
+    assert stats['hit_rate'] == pytest.approx(0.5)
+    cache.clear()
+    assert cache.stats()['size'] == 0 and cached(cache, 'a')
+
+
+
+def test_equal_inputs_share_a_key():
+    assert canonical_key(30, 425.0, fees=np.array([0.0, 0.3])) == canonical_key(30.0, 425, fees=[0, 0.3])
+    assert canonical_key({'ETF': 0.5, 'SCPI': 0.5}) == canonical_key({'SCPI': 0.5, 'ETF': 0.5})
+    assert canonical_key(30) != canonical_key(31)
+    with pytest.raises(TypeError):
+        canonical_key(object())
@@ -0,0 +1,58 @@
+"""
+Sustainable withdrawal solver against month-by-month reference paths.
+"""
+import numpy as np
+import pytest
+
+from holdi.decumulation import solve_withdrawal
+
+
+# 35 years old, withdrawals from 65 until 95
+PLAN = dict(years=60, monthly_amount=425, weighted_annual_return=0.06, initial_amount=10000, inflation_rate=2, years_until_withdrawal=30)
+
+
+
+def lowest_value(rate=0.0, income=0.0, years=60, monthly_amount=425, weighted_annual_return=0.06, initial_amount=10000, inflation_rate=2,
+                 years_until_withdrawal=30):
+    """
+    Lowest month-end value of the withdrawal phase, contributing until the withdrawals start
+    """
+    growth = (1 + weighted_annual_return) ** (1 / 12)
+    value = initial_amount
+    for _ in range(12 * years_until_withdrawal):
+        value = value * growth + monthly_amount * (1 + inflation_rate / 100)
+    lowest = np.inf
+    for month in range(12 * (years - years_until_withdrawal)):
+        value *= growth
+        value -= value * rate / 1200 + income * (1 + inflation_rate / 100) ** (month // 12)
+        lowest = min(lowest, value)
+    return lowest
+
+
+
+def test_rate_without_floor_is_unbounded():
+    solution = solve_withdrawal(**PLAN, floor=0, target='withdrawal_rate')
+    assert solution['unbounded']
+    assert np.isnan(solution['level'])
+    # Monte Carlo paths are all unbounded too
+    solution = solve_withdrawal(**PLAN, floor=0, target='withdrawal_rate', annual_volatility=0.1, n_paths=500, seed=0)
+    assert solution['unbounded'] and solution['success_probability'] == 1
+
+
+
+@pytest.mark.parametrize('floor', [1000, 50000])
+def test_rate_reaches_the_floor(floor):
+    solution = solve_withdrawal(**PLAN, floor=floor, target='withdrawal_rate', tolerance=1e-6)
+    assert not solution['unbounded']
+    assert 0 < solution['level'] < 100
+    assert lowest_value(rate=solution['level']) >= floor
+    assert lowest_value(rate=solution['level'] + 1e-3) < floor
+
+
+
+def test_income_reaches_the_floor():
+    solution = solve_withdrawal(**PLAN, floor=20000, target='monthly_income')
+    assert not solution['unbounded']
+    assert lowest_value(income=solution['level']) == pytest.approx(20000, rel=1e-9)
+    # The first withdrawal year pays twelve months of income
+    assert solution['income'][1, 30] == pytest.approx(12 * solution['level'])
@@ -0,0 +1,113 @@
+"""
+Closed-form projection against a month-by-month reference loop.
+"""
+import numpy as np
+import pytest
+
+from holdi.assets import get_allocation_index
+from holdi.engine import future_value_batch, net_annual_return, simulate_investment, simulate_investment_batch, simulate_investment_monthly
+from holdi.solver import solve_monthly_amount
+
+
+# Default profile of the simulator page: 2 500 € salary, 17% invested, 30 years old, balanced
+DEFAULT_PROFILE = dict(years=30, monthly_amount=425, weighted_annual_return=0.118184, initial_amount=425,
+                       inflation_rate=2, withdrawal_rate=0, years_until_withdrawal=5)
+# Personne physique without fees: flat tax paid when the gains are realized
+FLAT_TAX = (0.0, 0.0, 0.0, 0.30)
+
+
+
+def reference_loop(years, monthly_amount, weighted_annual_return, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal,
+                   fees=FLAT_TAX):
+    """
+    Year-end values after the tax at realization and withdrawals of the last year, month by month;
+    weighted_annual_return is one return or the return of every year (a glide path)
+    """
+    entry_fee, management_fee, gains_tax, exit_tax = fees
+    annual_returns = np.broadcast_to(np.asarray(weighted_annual_return, dtype=float), (years,))
+    paid = monthly_amount * (1 + inflation_rate / 100)
+    keep = 1 - withdrawal_rate / 1200
+    value, basis = initial_amount * (1 - entry_fee), initial_amount
+    values = []
+    for year in range(years):
+        growth = (1 + float(net_annual_return(annual_returns[year], management_fee, gains_tax))) ** (1 / 12)
+        withdrawn = 0.0
+        for _ in range(12):
+            value = value * growth + paid * (1 - entry_fee)
+            basis += paid
+            if year >= years_until_withdrawal:
+                value *= keep
+                basis *= keep
+                withdrawn += (1 - keep) * (value - exit_tax * max(value - basis, 0))
+        values.append(value - exit_tax * max(value - basis, 0))
+    return np.array(values), withdrawn
+
+
+
+def test_default_profile_is_taxed_at_realization():
+    expected, _ = reference_loop(**DEFAULT_PROFILE)
+    _, initial_amount, invested, earnings, _ = simulate_investment(**DEFAULT_PROFILE, fees=FLAT_TAX)
+    np.testing.assert_allclose(initial_amount + invested + earnings, expected, rtol=1e-9)
+    # The gain over the amounts paid in is taxed once, at the horizon
+    gross = future_value_batch(**DEFAULT_PROFILE)[0]
+    assert gross == pytest.approx(1288500, rel=1e-5)
+    assert expected[-1] == pytest.approx(948895, rel=1e-5)
+    assert expected[-1] == pytest.approx(gross - 0.30 * (gross - (425 + 30 * 12 * 425 * 1.02)), rel=1e-9)
+
+
+
+def test_withdrawals_pay_the_tax_on_their_share_of_the_gain():
+    profile = dict(DEFAULT_PROFILE, withdrawal_rate=4)
+    expected, withdrawn = reference_loop(**profile)
+    _, initial_amount, invested, earnings, last_year_withdraw_amount = simulate_investment(**profile, fees=FLAT_TAX)
+    np.testing.assert_allclose(initial_amount + invested + earnings, expected, rtol=1e-9)
+    assert last_year_withdraw_amount == pytest.approx(withdrawn, rel=1e-9)
+    monthly = simulate_investment_monthly(**profile, fees=FLAT_TAX)[0, 12::12]
+    np.testing.assert_allclose(monthly, expected, rtol=1e-9)
+
+
+
+def test_yearly_tax_for_companies():
+    fees = (0.01, 0.005, 0.25, 0.0)
+    expected, _ = reference_loop(**DEFAULT_PROFILE, fees=fees)
+    _, initial_amount, invested, earnings, _ = simulate_investment(**DEFAULT_PROFILE, fees=fees)
+    np.testing.assert_allclose(initial_amount + invested + earnings, expected, rtol=1e-9)
+
+
+
+@pytest.mark.parametrize('fees', [FLAT_TAX, (0.01, 0.005, 0.25, 0.0)])
+def test_glide_path_follows_the_return_of_every_year(fees):
+    # Clients of different ages and profiles, each following the age bucket reached every year
+    profile = dict(DEFAULT_PROFILE, withdrawal_rate=4, years_until_withdrawal=20)
+    ages = np.array([25, 40, 58])
+    annual_returns = get_allocation_index().glide_path_returns(ages, ['Profil Prudent', 'Profil Équilibré', 'Profil Dynamique'], profile['years'])
+    assert (annual_returns.min(axis=1) < annual_returns.max(axis=1)).all()
+
+    profile.pop('weighted_annual_return')
+    _, initial_amount, invested, earnings, _ = simulate_investment_batch(
+        **{name: np.full(len(ages), value) for name, value in profile.items()}, weighted_annual_return=annual_returns[:, 0],
+        annual_returns=annual_returns, fees=fees)
+    for client, returns in enumerate(annual_returns):
+        expected, _ = reference_loop(**profile, weighted_annual_return=returns, fees=fees)
+        np.testing.assert_allclose((initial_amount + invested + earnings)[client], expected, rtol=1e-9)
+
+
+
+def test_constant_glide_path_is_the_scalar_return():
+    years = DEFAULT_PROFILE['years']
+    for fees in (None, FLAT_TAX):
+        scalar = simulate_investment(**DEFAULT_PROFILE, fees=fees)
+        constant = simulate_investment(**DEFAULT_PROFILE, annual_returns=np.full(years, DEFAULT_PROFILE['weighted_annual_return']), fees=fees)
+        for expected, value in zip(scalar, constant):
+            np.testing.assert_allclose(value, expected, rtol=1e-12)
+
+
+
+
+def test_monthly_amount_solver_reaches_the_net_target():
+    profile = {name: value for name, value in DEFAULT_PROFILE.items() if name != 'monthly_amount'}
+    targets = np.array([1000.0, 200000.0, 948895.0])
+    monthly_amount = solve_monthly_amount(targets, **profile, fees=FLAT_TAX)
+    assert monthly_amount[0] == 0
+    np.testing.assert_allclose(future_value_batch(**profile, monthly_amount=monthly_amount[1:], fees=FLAT_TAX), targets[1:], rtol=1e-9)
+    assert monthly_amount[2] == pytest.approx(425, rel=1e-5)
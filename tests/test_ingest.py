@@ -0,0 +1,68 @@
+"""
+Ingest of the workbook into databases written by older versions of the script.
+"""
+import shutil
+import sqlite3
+
+import numpy as np
+
+from holdi.assets import get_asset_covariance, get_fee_schedule, query_asset_covariance, query_fee_rows
+from holdi.montecarlo import covariance_from_ratings
+from ingest_assets import WORKBOOK_PATH, ingest
+
+
+
+def old_database(tmp_path):
+    """
+    Database of an ingest made before the asset_covariance and asset_fees tables existed
+    """
+    db_path = str(tmp_path / 'investment_data.db')
+    workbook_path = str(tmp_path / 'calculateur_holdi.xlsx')
+    shutil.copy(WORKBOOK_PATH, workbook_path)
+    ingest(workbook_path, db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DROP TABLE asset_covariance")
+        conn.execute("DROP TABLE asset_fees")
+    return workbook_path, db_path
+
+
+
+def tables(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+
+def test_unchanged_workbook_completes_an_old_database(tmp_path):
+    workbook_path, db_path = old_database(tmp_path)
+    assert not {'asset_covariance', 'asset_fees'} & tables(db_path)
+
+    version, written = ingest(workbook_path, db_path)
+    assert (version, written) == (1, False)
+    assert {'asset_covariance', 'asset_fees'} <= tables(db_path)
+    with sqlite3.connect(db_path) as conn:
+        funds = conn.execute("SELECT COUNT(*) FROM asset_rows WHERE version = 1").fetchone()[0]
+        assert conn.execute("SELECT COUNT(*) FROM asset_covariance WHERE version = 1").fetchone()[0] == funds ** 2
+        assert conn.execute("SELECT COUNT(*) FROM asset_fees WHERE version = 1").fetchone()[0] == 2 * funds
+        rows = conn.execute('SELECT "FONDS PROPOSÉS A TERME", "Notation du risque" FROM asset_rows WHERE version = 1 ORDER BY rowid').fetchall()
+    fund_names, ratings = zip(*rows)
+
+    # The loaders read the stored tables instead of falling back to the ratings and default rates
+    assert query_asset_covariance(fund_names, db_path) is not None
+    np.testing.assert_allclose(get_asset_covariance(db_path), covariance_from_ratings(ratings))
+    assert len(query_fee_rows(db_path)) == 2 * funds
+    assert get_fee_schedule(db_path).funds == tuple(fund_names)
+
+    # Nothing more is written by the next runs
+    assert ingest(workbook_path, db_path) == (1, False)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM asset_fees").fetchone()[0] == 2 * funds
+
+
+
+def test_new_version_of_an_old_database(tmp_path):
+    workbook_path, db_path = old_database(tmp_path)
+    assert ingest(workbook_path, db_path, force=True) == (2, True)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM asset_fees WHERE version = 1").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM asset_fees WHERE version = 2").fetchone()[0] > 0
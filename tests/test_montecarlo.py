@@ -0,0 +1,98 @@
+"""
+Streaming Monte Carlo percentiles against the exact percentiles of the same paths.
+"""
+import numpy as np
+import pytest
+
+from holdi.montecarlo import (RISK_VOLATILITY, QuantileHistogram, calculate_portfolio_volatility, covariance_factor,
+                              covariance_from_ratings, simulate_investment_monte_carlo, simulate_investment_multi_asset)
+
+
+PERCENTILES = (5, 50, 95)
+
+
+
+def test_histogram_percentiles_match_exact_percentiles():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(np.log([1e3, 1e5, 1e7]), 1.0, size=(50001, 3))
+    histogram = QuantileHistogram(3)
+    for chunk in np.array_split(values, 7):
+        for column in range(3):
+            histogram.add(column, chunk[:, column])
+    np.testing.assert_allclose(histogram.percentiles(PERCENTILES), np.percentile(values, PERCENTILES, axis=0), rtol=1e-3)
+
+
+
+def test_histogram_keeps_values_out_of_range():
+    histogram = QuantileHistogram(1)
+    histogram.add(0, [0.0, -5.0, 1e20])
+    np.testing.assert_allclose(histogram.percentiles((0, 50, 100))[:, 0], [0.0, 0.0, 1e13])
+
+
+
+@pytest.mark.parametrize('chunk_size', [10000, 700])
+def test_monte_carlo_percentiles_match_the_paths(chunk_size):
+    years, monthly_amount, weighted_annual_return, annual_volatility = 20, 425, 0.08, 0.12
+    initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal = 425, 2, 4, 10
+    _, bands = simulate_investment_monte_carlo(
+        years, monthly_amount, weighted_annual_return, annual_volatility, initial_amount, inflation_rate, withdrawal_rate,
+        years_until_withdrawal, n_paths=5000, percentiles=PERCENTILES, chunk_size=chunk_size, seed=0)
+
+    # The same draws, path by path
+    rng = np.random.default_rng(0)
+    monthly_volatility = annual_volatility / np.sqrt(12)
+    drift = np.log(1 + weighted_annual_return) / 12 - monthly_volatility ** 2 / 2
+    values = np.empty((5000, years))
+    for start in range(0, 5000, chunk_size):
+        stop = min(start + chunk_size, 5000)
+        value = np.full(stop - start, float(initial_amount))
+        for year in range(years):
+            growth = np.exp(rng.normal(drift, monthly_volatility, size=(12, stop - start)))
+            for month in range(12):
+                value = value * growth[month] + monthly_amount * (1 + inflation_rate / 100)
+                if year >= years_until_withdrawal:
+                    value *= 1 - withdrawal_rate / 1200
+            values[start:stop, year] = value
+    np.testing.assert_allclose(bands, np.percentile(values, PERCENTILES, axis=0), rtol=2e-3)
+
+
+
+def test_multi_asset_percentiles_match_the_paths():
+    years, monthly_amount, initial_amount, inflation_rate = 15, 425, 425, 2
+    allocation = np.array([0.5, 0.3, 0.2])
+    fund_returns = np.array([0.08, 0.05, 0.02])
+    covariance = covariance_from_ratings([4, 3, 1])
+    _, bands = simulate_investment_multi_asset(years, monthly_amount, allocation, fund_returns, covariance, initial_amount, inflation_rate,
+                                               0, 100, 'monthly', n_paths=4000, percentiles=PERCENTILES, seed=0)
+
+    # The same draws, rebalanced every month
+    rng = np.random.default_rng(0)
+    monthly_covariance = covariance / 12
+    factor_t = covariance_factor(monthly_covariance).T.astype(np.float32)
+    drift = (np.log1p(fund_returns) / 12 - np.diag(monthly_covariance) / 2).astype(np.float32)
+    value = np.full(4000, float(initial_amount))
+    values = np.empty((4000, years))
+    for year in range(years):
+        growth = np.exp(rng.standard_normal((12, 4000, 3), dtype=np.float32) @ factor_t + drift) @ allocation.astype(np.float32)
+        for month in range(12):
+            value = value * growth[month] + monthly_amount * (1 + inflation_rate / 100)
+        values[:, year] = value
+    np.testing.assert_allclose(bands, np.percentile(values, PERCENTILES, axis=0), rtol=2e-3)
+
+
+
+@pytest.mark.parametrize('rebalancing', ['monthly', 'yearly'])
+def test_multi_asset_holds_the_unallocated_share_as_cash(rebalancing):
+    # A portfolio-form allocation adding up to 90%, the rest earning nothing as in the weighted return
+    years, monthly_amount, initial_amount, inflation_rate, withdrawal_rate, years_until_withdrawal = 30, 425, 425, 2, 4, 20
+    allocation = np.array([0.5, 0.25, 0.15])
+    fund_returns = np.array([0.08, 0.05, 0.02])
+    ratings = [4, 3, 1]
+    volatility = calculate_portfolio_volatility(dict(enumerate(RISK_VOLATILITY[rating] for rating in ratings)), dict(enumerate(allocation)))
+    _, funds = simulate_investment_multi_asset(
+        years, monthly_amount, allocation, fund_returns, covariance_from_ratings(ratings), initial_amount, inflation_rate, withdrawal_rate,
+        years_until_withdrawal, rebalancing, n_paths=10000, percentiles=PERCENTILES, seed=1)
+    _, aggregated = simulate_investment_monte_carlo(
+        years, monthly_amount, float(allocation @ fund_returns), volatility, initial_amount, inflation_rate, withdrawal_rate,
+        years_until_withdrawal, n_paths=10000, percentiles=PERCENTILES, seed=1)
+    np.testing.assert_allclose(funds, aggregated, rtol=0.03)
@@ -0,0 +1,74 @@
+"""
+Saved scenarios: storage round trip, and the batched comparison against single simulations.
+"""
+import numpy as np
+import pytest
+
+from holdi.assets import get_allocation_index, get_fee_schedule
+from holdi.engine import simulate_investment
+from holdi.fees import DEFAULT_STATUS
+from holdi.scenarios import SCENARIO_PARAMETERS, ScenarioStore, evaluate_scenarios
+
+
+PARAMETERS = dict(years=30, monthly_amount=425, initial_amount=425, inflation_rate=2, withdrawal_rate=0, years_until_withdrawal=5)
+
+
+
+def scenario(name, allocation, **parameters):
+    return {'name': name, 'parameters': dict(PARAMETERS, **parameters), 'allocation': allocation}
+
+
+
+def test_saved_scenarios_are_loaded_back(tmp_path):
+    store = ScenarioStore(str(tmp_path / 'scenarios.db'))
+    retirement = scenario('Retraite', {'ETF': 0.6, 'SCPI': 0.4}, withdrawal_rate=4, glide_path=True, age=40,
+                          investor_profile='Profil Dynamique', status='Personne morale')
+    store.save('alice', retirement['name'], retirement['parameters'], retirement['allocation'])
+    store.save('alice', 'Prudent', PARAMETERS, {'Obligations': 1.0})
+    store.save('bob', 'Retraite', PARAMETERS, {'ETF': 1.0})
+
+    assert store.load('alice', ['Retraite']) == [retirement]
+    assert sorted(store.names('alice')) == ['Prudent', 'Retraite']
+    # In the order asked for, unknown names skipped, other workspaces untouched
+    assert [loaded['name'] for loaded in store.load('alice', ['Prudent', 'Inconnu', 'Retraite'])] == ['Prudent', 'Retraite']
+    assert store.load('bob', ['Retraite'])[0]['allocation'] == {'ETF': 1.0}
+
+    # Saving under an existing name replaces the scenario, and it is listed first
+    store.save('alice', 'Prudent', dict(PARAMETERS, years=10), {'Obligations': 0.5, 'SCPI': 0.5})
+    assert store.names('alice')[0] == 'Prudent'
+    assert store.load('alice', ['Prudent'])[0]['parameters']['years'] == 10
+    store.delete('alice', 'Prudent')
+    assert store.names('alice') == ['Retraite']
+    assert store.load('alice', []) == []
+    store.pool.close()
+
+
+
+@pytest.mark.parametrize('with_fees', [False, True])
+def test_batched_comparison_matches_single_simulations(with_fees):
+    index = get_allocation_index()
+    fee_schedule = get_fee_schedule() if with_fees else None
+    scenarios = [
+        scenario('Équilibré', {'ETF': 0.5, 'SCPI': 0.3, 'Obligations': 0.2}),
+        scenario('Court', {'Crowdlending': 0.7, 'CAT': 0.3}, years=8, withdrawal_rate=4, years_until_withdrawal=3, status='Personne morale'),
+        scenario('Glide', {'ETF': 1.0}, years=40, glide_path=True, age=35, investor_profile='Profil Prudent'),
+        scenario('Incomplet', {'ETF': 0.6, 'Cryptomonnaie (230%)': 0.1}, years=20, withdrawal_rate=5, years_until_withdrawal=12),
+    ]
+    result = evaluate_scenarios(scenarios, index, fee_schedule)
+
+    for i, saved in enumerate(scenarios):
+        parameters = saved['parameters']
+        allocation = index.allocation_vector(saved['allocation'])
+        annual_returns = None
+        if parameters.get('glide_path'):
+            annual_returns = index.glide_path_returns(parameters['age'], parameters['investor_profile'], parameters['years'])[0]
+        fees = None if fee_schedule is None else fee_schedule.portfolio_fees(parameters.get('status', DEFAULT_STATUS), allocation)
+        _, initial_amount, invested, earnings, withdrawn = simulate_investment(
+            *(parameters[name] for name in SCENARIO_PARAMETERS[:2]), index.portfolio_returns(allocation),
+            *(parameters[name] for name in SCENARIO_PARAMETERS[2:]), annual_returns=annual_returns, fees=fees)
+        values = initial_amount + invested + earnings
+        years = parameters['years']
+        np.testing.assert_allclose(result['values'][i, :years], values, rtol=1e-12)
+        assert np.isnan(result['values'][i, years:]).all()
+        assert result['future_value'][i] == pytest.approx(values[-1], rel=1e-12)
+        assert result['monthly_income'][i] == pytest.approx(withdrawn / 12, rel=1e-12)
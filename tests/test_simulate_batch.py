@@ -0,0 +1,89 @@
+"""
+Chunked bulk simulation against one simulate_investment per profile, and its resumption.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from holdi.assets import get_allocation_index, get_fee_schedule
+from holdi.engine import simulate_investment
+from simulate_batch import main, run
+
+
+
+def write_profiles(path, count=23):
+    """
+    Profiles of every investor profile and status, some with overrides and some relying on the defaults
+    """
+    rng = np.random.default_rng(0)
+    profiles = pd.DataFrame({
+        'id': [f'client-{i}' for i in range(count)],
+        'salary': rng.integers(1500, 6000, count),
+        'age': rng.integers(18, 70, count),
+        'investment_perc': rng.integers(5, 30, count),
+        'investor_profile': rng.choice(['Profil Prudent', 'Profil Équilibré', 'Profil Dynamique'], count),
+        'status': rng.choice(['Personne physique', 'Personne morale'], count),
+        'withdrawal_rate': np.where(rng.random(count) < 0.5, 4.0, np.nan),
+        'years': np.where(rng.random(count) < 0.3, 12.0, np.nan),
+    })
+    profiles.to_csv(path, index=False)
+    return profiles
+
+
+
+def expected_results(profile):
+    """
+    Results of one profile, with the defaults of the profile form of the simulator page
+    """
+    savings = int(profile.salary * profile.investment_perc / 100)
+    years = int(np.clip(60 - profile.age if np.isnan(profile.years) else profile.years, 3, 50))
+    withdrawal_rate = 0 if np.isnan(profile.withdrawal_rate) else profile.withdrawal_rate
+    index = get_allocation_index()
+    fees = get_fee_schedule().portfolio_fees(profile.status, index.allocation(profile.age, profile.investor_profile))
+    _, initial_amount, invested, earnings, withdrawn = simulate_investment(
+        years, savings, index.weighted_return(profile.age, profile.investor_profile), savings, 2, withdrawal_rate, 5, fees=fees)
+    return {
+        'future_value': initial_amount + invested[-1] + earnings[-1],
+        'capital_gain': earnings[-1],
+        'invested_and_initial_value': initial_amount + invested[-1],
+        'monthly_income': withdrawn / 12,
+    }
+
+
+
+def read_results(output_dir):
+    parts = sorted(name for name in os.listdir(output_dir) if name.startswith('part-'))
+    return parts, pd.concat([pd.read_csv(os.path.join(output_dir, name)) for name in parts], ignore_index=True)
+
+
+
+def test_chunks_match_single_simulations_and_resume(tmp_path):
+    input_path, output_dir = str(tmp_path / 'profiles.csv'), str(tmp_path / 'results')
+    profiles = write_profiles(input_path)
+
+    assert run(input_path, output_dir, chunk_size=10, workers=2) == len(profiles)
+    parts, results = read_results(output_dir)
+    assert parts == ['part-00000.csv', 'part-00001.csv', 'part-00002.csv']
+    assert results['id'].tolist() == profiles['id'].tolist()
+    for profile, result in zip(profiles.itertuples(), results.itertuples()):
+        assert (result.investor_profile, result.status) == (profile.investor_profile, profile.status)
+        for column, value in expected_results(profile).items():
+            assert getattr(result, column) == pytest.approx(value, rel=1e-9, abs=1e-9)
+
+    # The second run finds every part written and simulates nothing
+    modified = {name: os.stat(os.path.join(output_dir, name)).st_mtime_ns for name in parts}
+    assert run(input_path, output_dir, chunk_size=10, workers=2) == 0
+    assert {name: os.stat(os.path.join(output_dir, name)).st_mtime_ns for name in parts} == modified
+    # A missing part is simulated again, alone
+    os.remove(os.path.join(output_dir, 'part-00001.csv'))
+    assert run(input_path, output_dir, chunk_size=10, workers=2) == 10
+    pd.testing.assert_frame_equal(read_results(output_dir)[1], results)
+
+    # The parts of another chunk size would not line up with the ones written
+    with pytest.raises(SystemExit):
+        run(input_path, output_dir, chunk_size=5, workers=2)
+    with pytest.raises(SystemExit):
+        main([input_path, output_dir, '--chunk-size', '7', '--workers', '1'])
+    assert read_results(output_dir)[0] == parts
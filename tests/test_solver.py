@@ -0,0 +1,69 @@
+"""
+Goal seek and sensitivity sweeps against direct batch simulations.
+"""
+import numpy as np
+import pytest
+
+from holdi.engine import future_value_batch
+from holdi.solver import solve_annual_return, solve_years, sweep_future_value
+
+
+# Default profile of the simulator page, and the flat tax of a Personne physique paid at realization
+DEFAULT_PROFILE = dict(years=30, monthly_amount=425, weighted_annual_return=0.118184, initial_amount=425,
+                       inflation_rate=2, withdrawal_rate=0, years_until_withdrawal=5)
+FLAT_TAX = (0.0, 0.0, 0.0, 0.30)
+
+
+
+def without(*names):
+    return {name: value for name, value in DEFAULT_PROFILE.items() if name not in names}
+
+
+
+@pytest.mark.parametrize('fees', [None, FLAT_TAX])
+def test_solved_horizon_is_the_first_year_reaching_the_target(fees):
+    profile = without('years')
+    targets = np.array([1000.0, 200000.0, 948895.0, 5e6])
+    years = solve_years(targets, **profile, fees=fees)
+    assert np.isfinite(years).all()
+    np.testing.assert_array_less(future_value_batch(years - 1, **profile, fees=fees)[years > 1], targets[years > 1])
+    assert (future_value_batch(years, **profile, fees=fees) >= targets).all()
+
+
+
+def test_solved_return_reaches_the_target():
+    profile = without('weighted_annual_return')
+    targets = np.array([200000.0, 948895.0, 5e6])
+    annual_return = solve_annual_return(targets, **profile, fees=FLAT_TAX)
+    np.testing.assert_allclose(future_value_batch(**profile, weighted_annual_return=annual_return, fees=FLAT_TAX), targets, rtol=1e-5)
+    assert annual_return[1] == pytest.approx(0.118184, abs=1e-6)
+
+
+
+def test_unreachable_targets_are_nan():
+    assert np.isnan(solve_years([1e15], **without('years'), max_years=50)).all()
+    # Above the value at the highest return, or already exceeded at the lowest one
+    annual_return = solve_annual_return([1e15, 1.0], **without('weighted_annual_return'))
+    assert np.isnan(annual_return).all()
+    # Mixed with reachable targets, only the unreachable ones are NaN
+    years = solve_years([1e15, 200000.0], **without('years'))
+    assert np.isnan(years[0]) and np.isfinite(years[1])
+
+
+
+@pytest.mark.parametrize('fees', [None, FLAT_TAX])
+def test_sweep_grid_matches_pointwise_simulations(fees):
+    axes = {'monthly_amount': np.array([0.0, 425.0, 1000.0]), 'years': np.array([3.0, 10.0, 30.0, 50.0]),
+            'withdrawal_rate': np.array([0.0, 4.0])}
+    base = dict(without(*axes), fees=fees)
+    grid = sweep_future_value(base, axes)
+    assert grid.shape == (3, 4, 2)
+    for point in np.ndindex(grid.shape):
+        inputs = {parameter: values[i] for (parameter, values), i in zip(axes.items(), point)}
+        assert grid[point] == pytest.approx(future_value_batch(**base, **inputs)[0], rel=1e-12)
+
+
+
+def test_sweep_refuses_unknown_parameters():
+    with pytest.raises(ValueError):
+        sweep_future_value(DEFAULT_PROFILE, {'salary': [1000, 2000]})